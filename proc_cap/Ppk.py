@@ -2,11 +2,17 @@
 
 from pl0t import *
 import scipy
+import scipy.optimize
+import scipy.special
+import scipy.stats
 import numpy as np
 import Log
 import random
 import string
 import pandas as pd
+import hashlib
+import columnar
+from concurrent.futures import ProcessPoolExecutor
 
 def norm(x, lsl = None, usl = None):
     '''
@@ -15,63 +21,640 @@ def norm(x, lsl = None, usl = None):
     lsl: Lower Specification Limit
     usl: Upper Specification Limit
     '''
-    ret = 0.0
-    if not lsl and not usl:
-        raise SyntaxError('LSL and / or USL needed')
-    if lsl is not None and usl is not None:
-        if lsl > usl:
-            raise SyntaxError('LSL must be stricly inferior to USL')
+    _chk_limits(lsl, usl)
     mu, std = scipy.stats.norm.fit(x)
-    if lsl and not usl:
-        ret = PpX(mu, std, lsl)
-    elif not lsl and usl:
-        ret = PpX(mu, std, usl)
-    else:
-        ret = Ppk(mu, std, lsl, usl) 
-    return ret
+    return Ppk(mu, std, usl, lsl)
 
-def PpX(mu, std, spec, mul = 3):
+def PpX(mu, std, spec, mul = 3, upper = False):
     '''
-    Return Long Term Process Capability on spec
+    Return Long Term Process Capability on spec, negative when mu is beyond
+    spec (NaN if spec is None)
     mu: mean of normal fitted data
     std: std of normal fitted data
-    spec: specification limit (can be Lower or Upper)
+    spec: specification limit
     mul: 6 sigma multiplier
+    upper: if True, spec is an Upper Specification Limit, else a Lower one
     '''
-    ret = np.abs(mu - spec) / (mul * std)
+    spec = np.nan if spec is None else spec
+    ret = ((spec - mu) if upper else (mu - spec)) / (mul * std)
     return ret
 
 def Ppk(mu, std, usl, lsl, mul = 3):
     '''
-    Return Long Term Process Capability
+    Return Long Term Process Capability, min of PpU and PpL (works on arrays)
     mu: mean of normal fitted data
     std: std of normal fitted data
+    lsl: Lower Specification Limit (None if one-sided)
+    usl: Upper Specification Limit (None if one-sided)
+    mul: 6 sigma multiplier
+    '''
+    PpU = PpX(mu, std, usl, mul, upper=True)
+    PpL = PpX(mu, std, lsl, mul)
+    return np.fmin(PpU, PpL)
+
+def _chk_limits(lsl, usl):
+    '''
+    Raise SyntaxError if both specification limits are None or lsl > usl
+    '''
+    if lsl is None and usl is None:
+        raise SyntaxError('LSL and / or USL needed')
+    if lsl is not None and usl is not None and lsl > usl:
+        raise SyntaxError('LSL must be stricly inferior to USL')
+
+def Ppk2ppm(ppk, two_sided=False, mul=3):
+    '''
+    Return expected defect occurrence (in ppm) of a normal process of given
+    Ppk (works on arrays)
+    ppk: Long Term Process Capability
+    two_sided: if True, process is centred and both tails are counted
+    mul: 6 sigma multiplier
+    '''
+    ret = 0.5 * scipy.special.erfc(mul * np.asarray(ppk, dtype=float) / np.sqrt(2)) * 10**6
+    if two_sided:
+        ret *= 2
+    return ret
+
+
+def ppm2Ppk(ppm, two_sided=False, mul=3):
+    '''
+    Return Ppk of a normal process of given expected defect occurrence
+    (inverse of Ppk2ppm(), works on arrays)
+    ppm: defect occurrence (in ppm)
+    two_sided: if True, process is centred and ppm is split on both tails
+    mul: 6 sigma multiplier
+    '''
+    p = np.asarray(ppm, dtype=float) / 10**6
+    if two_sided:
+        p = p / 2
+    # ndtri on the tail probability keeps accuracy far below 1 ppm
+    return -scipy.special.ndtri(p) / mul
+
+
+def norm_ppm(mu, std, lsl, usl):
+    '''
+    Return expected defect occurrence (in ppm) beyond lsl and usl of normal
+    processes (works on arrays)
+    mu: mean of normal fitted data
+    std: std of normal fitted data
+    lsl: Lower Specification Limit (None if unilateral)
+    usl: Upper Specification Limit (None if unilateral)
+    '''
+    _chk_limits(lsl, usl)
+    mu = np.asarray(mu, dtype=float)
+    scale = np.asarray(std, dtype=float) * np.sqrt(2)
+    ret = np.zeros(np.broadcast(mu, scale).shape)
+    if lsl is not None:
+        ret = ret + 0.5 * scipy.special.erfc((mu - lsl) / scale)
+    if usl is not None:
+        ret = ret + 0.5 * scipy.special.erfc((usl - mu) / scale)
+    return ret * 10**6
+
+
+def batch_ppk(dat, cat, val, lsl, usl, mul=3, dist='norm', workers=1):
+    '''
+    Return a dataframe of process capability per category (cat, n, mu, std,
+    PpL, PpU, Ppk), computed in a single pass over the data for normal law.
+    Non normal laws add lo, med, hi columns (quantiles at -mul, 0 and +mul
+    sigma equivalent levels) and capability follows ISO 22514-2 percentile
+    method: PpU = (usl - med) / (hi - med), PpL = (med - lsl) / (med - lo).
+    Box-Cox capability is normal capability of transformed data and limits.
+    Fits are cached by category data (see _fit_cache), unchanged categories
+    are not refitted.
+    dat: long format dataframe or columnar.segments (cat and val unused)
+    cat: category column
+    val: value column
     lsl: Lower Specification Limit
     usl: Upper Specification Limit
     mul: 6 sigma multiplier
+    dist: statistical law, either
+          - norm - normal law,
+          - percentile - empirical quantiles,
+          - boxcox - normal law of Box-Cox transformed data (data and limits > 0),
+          - johnson - Johnson SU law,
+          - gennorm - generalized normal law type 1
+    workers: number of processes sharing fits of categories
     '''
-    PpU = PpX(mu, std, usl)
-    PpL = PpX(mu, std, lsl)
-    if PpU >= PpL:
-        return PpL
-    return PpU
+    if dist == 'norm':
+        if isinstance(dat, columnar.segments):
+            cats = dat.cats
+            n, mu, std = dat.stats()
+        else:
+            codes, cats = pd.factorize(dat[cat], use_na_sentinel=False)
+            n, mu, std = columnar.group_stats(codes, dat[val].to_numpy(dtype=float), len(cats))
+        ret = pd.DataFrame({'cat': cats, 'n': n, 'mu': mu, 'std': std})
+        return ppk_table(ret, lsl, usl, mul)
+    if dist not in _FITS:
+        raise NotImplementedError
+    _chk_limits(lsl, usl)
+    segs = _segments(dat, cat, val)
+    n, mu, std = segs.stats()
+    ret = pd.DataFrame({'cat': segs.cats, 'n': n, 'mu': mu, 'std': std})
+    params = fit_cats(list(segs), dist, workers)
+    p = scipy.stats.norm.cdf([-mul, 0, mul])
+    if dist == 'percentile':
+        q = np.array([np.quantile(x, p) for x in segs])
+    else:
+        q = np.array([_FITS[dist][1](par, p) for par in params])
+    ret['lo'], ret['med'], ret['hi'] = q.T
+    nan = np.full(len(ret), np.nan)
+    if dist == 'boxcox':
+        if (lsl is not None and lsl <= 0) or (usl is not None and usl <= 0):
+            raise SyntaxError('Box-Cox needs strictly positive limits')
+        lmb, mu_t, std_t = np.array(params, dtype=float).reshape(-1, 3).T
+        bc = lambda spec: scipy.special.boxcox(spec, lmb)
+        ret['PpL'] = nan if lsl is None else (mu_t - bc(lsl)) / (mul * std_t)
+        ret['PpU'] = nan if usl is None else (bc(usl) - mu_t) / (mul * std_t)
+    else:
+        ret['PpL'] = nan if lsl is None else (ret['med'] - lsl) / (ret['med'] - ret['lo'])
+        ret['PpU'] = nan if usl is None else (usl - ret['med']) / (ret['hi'] - ret['med'])
+    ret['Ppk'] = np.fmin(ret['PpL'], ret['PpU'])
+    return ret
 
-def Ppk2ppm(ppk):
-    pass
 
-def batch_ppk(dat, cat, val, lsl, usl, mul=3, dist='norm'):
-    ret = {}
-    if dist == 'norm':
-        for c in dat[cat].unique():
-            x = dat[dat[cat] == c]['value']
-            ret[c] = norm(x, lsl=lsl, usl=usl)
+def fit_cats(segs, dist, workers=1):
+    '''
+    Return fitted parameters of dist for each vector of segs. Fits are
+    warm-started from moment / quantile estimates, spread over workers
+    processes and memoized in _fit_cache by dist and sorted data.
+    segs: list of 1D vectors (or columnar.segments)
+    dist: percentile, boxcox, johnson or gennorm (see batch_ppk())
+    workers: number of processes sharing fits
+    '''
+    if dist == 'percentile':
+        return [None] * len(segs)
+    keys = [(dist, hashlib.sha1(np.sort(x).tobytes()).hexdigest()) for x in segs]
+    todo = [i for i, key in enumerate(keys) if key not in _fit_cache]
+    todo = list({keys[i]: i for i in todo}.values())
+    args = [segs[i] for i in todo]
+    if workers == 1 or len(args) < 2:
+        res = [_FITS[dist][0](x) for x in args]
     else:
-        raise NotImplementedError
-    ret = pd.DataFrame(list(ret.items()))
-    ret.columns = ('cat', 'Ppk')  
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            res = list(pool.map(_FITS[dist][0], args,
+                                chunksize=max(1, len(args) // (4 * workers))))
+    for i, par in zip(todo, res):
+        _fit_cache[keys[i]] = par
+    ret = [_fit_cache[key] for key in keys]
+    # bounded cache, oldest fits first out
+    for key in list(_fit_cache)[:max(0, len(_fit_cache) - fit_cache_size)]:
+        del _fit_cache[key]
+    return ret
+
+
+def _fit_boxcox(x):
+    if np.any(x <= 0):
+        raise SyntaxError('Box-Cox needs strictly positive values')
+    if len(x) < 3 or np.std(x) == 0:
+        return (np.nan,) * 3
+    xt, lmb = scipy.stats.boxcox(x)
+    return (lmb, np.mean(xt), np.std(xt))
+
+
+def _ppf_boxcox(par, p):
+    lmb, mu, std = par
+    return scipy.special.inv_boxcox(scipy.stats.norm.ppf(p, loc=mu, scale=std), lmb)
+
+
+def _fit_johnson(x, z=0.524):
+    if len(x) < 4 or np.std(x) == 0:
+        return (np.nan,) * 4
+    # Slifker & Shapiro quantile estimates as starting point of the MLE
+    xm3, xm1, x1, x3 = np.quantile(x, scipy.stats.norm.cdf([-3 * z, -z, z, 3 * z]))
+    m, n, p = x3 - x1, xm1 - xm3, x1 - xm1
+    start = ()
+    if m * n / p ** 2 > 1:
+        mp, np_ = m / p, n / p
+        b = 2 * z / np.arccosh(0.5 * (mp + np_))
+        a = b * np.arcsinh((np_ - mp) / (2 * np.sqrt(mp * np_ - 1)))
+        scale = 2 * p * np.sqrt(mp * np_ - 1) / ((mp + np_ - 2) * np.sqrt(mp + np_ + 2))
+        loc = (x1 + xm1) / 2 + p * (np_ - mp) / (2 * (mp + np_ - 2))
+        if np.all(np.isfinite((a, b, scale, loc))) and scale > 0:
+            return scipy.stats.johnsonsu.fit(x, a, b, loc=loc, scale=scale)
+    return scipy.stats.johnsonsu.fit(x)
+
+
+def _ppf_johnson(par, p):
+    return scipy.stats.johnsonsu.ppf(p, *par)
+
+
+def _fit_gennorm(x):
+    if len(x) < 4 or np.std(x) == 0:
+        return (np.nan,) * 3
+    # beta from excess kurtosis: G(5/b) G(1/b) / G(3/b)**2 - 3
+    gln = scipy.special.gammaln
+    kurt = lambda b: np.exp(gln(5 / b) + gln(1 / b) - 2 * gln(3 / b)) - 3
+    k = np.clip(scipy.stats.kurtosis(x), kurt(50) + 1e-6, kurt(0.3) - 1e-6)
+    beta = scipy.optimize.brentq(lambda b: kurt(b) - k, 0.3, 50)
+    scale = np.std(x) * np.exp(0.5 * (gln(1 / beta) - gln(3 / beta)))
+    return scipy.stats.gennorm.fit(x, beta, loc=np.mean(x), scale=scale)
+
+
+def _ppf_gennorm(par, p):
+    return scipy.stats.gennorm.ppf(p, *par)
+
+
+# fit and quantile functions of non normal laws
+_FITS = {'percentile': (None, None),
+         'boxcox': (_fit_boxcox, _ppf_boxcox),
+         'johnson': (_fit_johnson, _ppf_johnson),
+         'gennorm': (_fit_gennorm, _ppf_gennorm)}
+# fitted parameters by (dist, data fingerprint)
+_fit_cache = {}
+fit_cache_size = 10**5
+
+
+def _segments(dat, cat, val):
+    '''
+    Return dat grouped by category as columnar.segments (dat itself if
+    already grouped)
+    '''
+    if isinstance(dat, columnar.segments):
+        return dat
+    return columnar.segments.from_frame(dat, cat, val)
+
+
+def ppk_table(stats, lsl, usl, mul=3):
+    '''
+    Add PpL, PpU and Ppk columns to a dataframe with mu and std columns
+    stats: dataframe with mu and std columns
+    lsl: Lower Specification Limit
+    usl: Upper Specification Limit
+    mul: 6 sigma multiplier
+    '''
+    _chk_limits(lsl, usl)
+    ret = stats.copy()
+    # signed: negative capability when mean is beyond a limit
+    ret['PpL'] = PpX(ret['mu'], ret['std'], lsl, mul)
+    ret['PpU'] = PpX(ret['mu'], ret['std'], usl, mul, upper=True)
+    ret['Ppk'] = np.fmin(ret['PpL'], ret['PpU'])
     return ret
 
 
+class ppk_acc():
+
+
+    def __init__(self):
+        '''
+        Mergeable streaming process capability per category: count, mean and
+        sum of squared deviations (Welford / Chan) are kept per category,
+        memory does not depend on the number of values
+        '''
+        self.cats = []
+        self.index = {}
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+
+    def update(self, values, cats=None):
+        '''
+        Add a batch of values
+        values: 1D vector of values
+        cats: category of each value, or a single category for the batch
+        '''
+        x = np.asarray(values, dtype=float)
+        if cats is None or np.ndim(cats) == 0:
+            codes, uniques = np.zeros(len(x), dtype=np.intp), [cats]
+        else:
+            codes, uniques = pd.factorize(np.asarray(cats), use_na_sentinel=False)
+        n, mu, std = columnar.group_stats(codes, x, len(uniques))
+        self.__combine(uniques, n, mu, n * std ** 2)
+        return self
+
+
+    def merge(self, other):
+        '''
+        Merge statistics of another ppk_acc object (other worker, shift...)
+        other: ppk_acc object
+        '''
+        self.__combine(other.cats, other.n, other.mean, other.m2)
+        return self
+
+
+    def stats(self):
+        '''
+        Return a dataframe of count, mean and standard deviation (ddof=0)
+        per category
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / self.n)
+        return pd.DataFrame({'cat': self.cats, 'n': self.n.astype(int),
+                             'mu': self.mean, 'std': std})
+
+
+    def ppk(self, lsl=None, usl=None, mul=3):
+        '''
+        Return a dataframe of process capability per category, as batch_ppk()
+        lsl: Lower Specification Limit
+        usl: Upper Specification Limit
+        mul: 6 sigma multiplier
+        '''
+        return ppk_table(self.stats(), lsl, usl, mul)
+
+
+    def __combine(self, cats, n, mean, m2):
+        idx = np.empty(len(cats), dtype=np.intp)
+        for i, c in enumerate(cats):
+            # missing categories share one key
+            c = _na_key(c)
+            if c not in self.index:
+                self.index[c] = len(self.cats)
+                self.cats.append(c)
+            idx[i] = self.index[c]
+        grow = len(self.cats) - len(self.n)
+        if grow:
+            self.n = np.concatenate((self.n, np.zeros(grow)))
+            self.mean = np.concatenate((self.mean, np.zeros(grow)))
+            self.m2 = np.concatenate((self.m2, np.zeros(grow)))
+        self.n[idx], self.mean[idx], self.m2[idx] = chan_merge(
+            self.n[idx], self.mean[idx], self.m2[idx], n, mean, m2)
+
+
+def file_ppk(path, cat, val, lsl, usl, mul=3, chunksize=10**6, fmt=None):
+    '''
+    Return a dataframe of process capability per category of a long format
+    CSV or Parquet file, as batch_ppk(). The file is read by batches of
+    chunksize rows into a ppk_acc object, memory does not depend on file size.
+    Parquet files need pyarrow.
+    path: file path
+    cat: category column
+    val: value column
+    lsl: Lower Specification Limit
+    usl: Upper Specification Limit
+    mul: 6 sigma multiplier
+    chunksize: number of rows read at once
+    fmt: either csv or parquet (guessed from path extension if None)
+    '''
+    if fmt is None:
+        fmt = 'parquet' if path.lower().endswith(('.parquet', '.pq')) else 'csv'
+    acc = ppk_acc()
+    if fmt == 'csv':
+        for chunk in pd.read_csv(path, usecols=[cat, val], chunksize=chunksize):
+            acc.update(chunk[val].to_numpy(dtype=float), chunk[cat].to_numpy())
+    elif fmt == 'parquet':
+        import pyarrow.parquet
+        pq = pyarrow.parquet.ParquetFile(path)
+        for batch in pq.iter_batches(batch_size=chunksize, columns=[cat, val]):
+            acc.update(batch.column(val).to_numpy(zero_copy_only=False).astype(float),
+                       batch.column(cat).to_numpy(zero_copy_only=False))
+    else:
+        raise SyntaxError('Unknown file format: %s' % str(fmt))
+    return acc.ppk(lsl, usl, mul)
+
+
+def _na_key(cat):
+    '''
+    Return cat, or np.nan itself for a NaN category (missing categories
+    factorized as NaN objects are not equal to each other as dict keys)
+    '''
+    return np.nan if isinstance(cat, float) and cat != cat else cat
+
+
+def chan_merge(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    '''
+    Return (count, mean, sum of squared deviations) of two merged samples
+    (Chan et al. parallel algorithm), element-wise on vectors
+    '''
+    tot = n_a + n_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where(n_b > 0, mean_b - mean_a, 0)
+        mean = np.where(tot > 0, mean_a + delta * n_b / tot, 0)
+        m2 = m2_a + np.where(n_b > 0, m2_b, 0) + \
+             np.where(tot > 0, delta ** 2 * n_a * n_b / tot, 0)
+    return (tot, mean, m2)
+
+
+def rolling_ppk(x, lsl=None, usl=None, window=30, time=None, cats=None,
+                min_periods=None, mul=3):
+    '''
+    Return the Ppk series over a moving window, aligned with x.
+    Window sums of x and x**2 are taken from cumulative sums of values
+    centered on their category mean (numerically stable), so each point
+    costs O(1) whatever the window.
+    x: 1D vector or Series of values
+    lsl: Lower Specification Limit
+    usl: Upper Specification Limit
+    window: number of values, or if time is set, duration of the window
+            ]t - window, t] (e.g. '1h' or pd.Timedelta for datetime time,
+            number in time unit for numeric time)
+    time: timestamps (datetime or numeric) of values for time-based windows
+    cats: category of each value (machine...), windows being per category
+    min_periods: minimum number of values in the window (window for count
+                 based windows, 2 for time-based ones if None)
+    mul: 6 sigma multiplier
+    '''
+    _chk_limits(lsl, usl)
+    index = x.index if isinstance(x, pd.Series) else pd.RangeIndex(len(x))
+    vals = np.asarray(x, dtype=float)
+    duration = isinstance(window, (str, pd.Timedelta, np.timedelta64))
+    if time is None and duration:
+        raise SyntaxError('time needed for a duration window')
+    if time is not None and not duration and \
+       (np.asarray(time).dtype.kind == 'M' or pd.api.types.is_datetime64_any_dtype(time)):
+        raise SyntaxError('Duration window (e.g. \'1h\') needed for datetime time')
+    codes = np.zeros(len(vals), dtype=np.intp)
+    if cats is not None:
+        codes = pd.factorize(np.asarray(cats), use_na_sentinel=False)[0]
+    if time is None:
+        order = np.argsort(codes, kind='stable')
+    else:
+        t = np.asarray(time)
+        if duration:
+            # timestamps and window in seconds
+            t = (pd.to_datetime(t) - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+            window = pd.Timedelta(window).total_seconds()
+        t = np.asarray(t, dtype=float)
+        order = np.lexsort((t, codes))
+        t = t[order]
+    codes = codes[order]
+    vals = vals[order]
+    ncat = codes.max() + 1 if len(codes) else 0
+    bounds = np.searchsorted(codes, np.arange(ncat + 1))
+    first = bounds[codes]
+    pos = np.arange(len(vals))
+    if time is None:
+        start = np.maximum(pos - window + 1, first)
+        if min_periods is None:
+            min_periods = window
+    else:
+        start = np.empty(len(vals), dtype=np.intp)
+        for c in range(ncat):
+            seg = slice(bounds[c], bounds[c + 1])
+            start[seg] = bounds[c] + np.searchsorted(t[seg], t[seg] - window, side='right')
+        if min_periods is None:
+            min_periods = 2
+    n, mu, std = columnar.group_stats(codes, vals, ncat)
+    centered = vals - mu[codes]
+    c1 = np.concatenate(([0.0], np.cumsum(centered)))
+    c2 = np.concatenate(([0.0], np.cumsum(centered ** 2)))
+    cnt = pos + 1 - start
+    s1 = (c1[pos + 1] - c1[start]) / cnt
+    var = np.maximum((c2[pos + 1] - c2[start]) / cnt - s1 ** 2, 0)
+    win = pd.DataFrame({'mu': mu[codes] + s1, 'std': np.sqrt(var)})
+    ppk = ppk_table(win, lsl, usl, mul)['Ppk'].to_numpy(copy=True)
+    ppk[cnt < min_periods] = np.nan
+    ret = np.empty(len(vals))
+    ret[order] = ppk
+    return pd.Series(ret, index=index, name='Ppk')
+
+
+def boot_ppk(dat, cat, val, lsl, usl, B=2000, alpha=0.05, method='percentile',
+             mul=3, chunk=10**7, workers=1, seed=None):
+    '''
+    Return a dataframe of bootstrap confidence intervals of Ppk per category
+    (cat, n, Ppk, lo, hi). Resamples of each category are drawn as (b x n)
+    index matrices and their Ppk computed with array reductions.
+    dat: long format dataframe or columnar.segments (cat and val unused)
+    cat: category column
+    val: value column
+    lsl: Lower Specification Limit
+    usl: Upper Specification Limit
+    B: number of bootstrap resamples
+    alpha: confidence
+    method: either percentile or bca (bias corrected and accelerated)
+    mul: 6 sigma multiplier
+    chunk: maximum number of resampled values held at once per category
+    workers: number of processes sharing the categories
+    seed: seed of the random generator (fresh entropy if None)
+    '''
+    _chk_limits(lsl, usl)
+    if method not in ('percentile', 'bca'):
+        raise SyntaxError('Unknown bootstrap method: %s' % str(method))
+    segs = _segments(dat, cat, val)
+    seeds = np.random.SeedSequence(seed).spawn(len(segs))
+    args = [(segs[i], lsl, usl, B, alpha, method, mul, chunk, seeds[i])
+            for i in range(len(segs))]
+    if workers == 1:
+        res = [_boot_cat(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            res = list(pool.map(_boot_cat, *zip(*args),
+                                chunksize=max(1, len(args) // (4 * workers))))
+    ret = pd.DataFrame(res, columns=('Ppk', 'lo', 'hi'))
+    ret.insert(0, 'n', segs.n)
+    ret.insert(0, 'cat', segs.cats)
+    return ret
+
+
+def _boot_cat(x, lsl, usl, B, alpha, method, mul, chunk, seed):
+    rng = np.random.default_rng(seed)
+    n = len(x)
+    nan = np.full(1, np.nan)
+    # signed capability, as ppk_table()
+    ppk = lambda mu, std: np.fmin(nan if lsl is None else (mu - lsl) / (mul * std),
+                                  nan if usl is None else (usl - mu) / (mul * std))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        theta = ppk(np.atleast_1d(np.mean(x)), np.atleast_1d(np.std(x)))[0]
+    if n < 2 or np.std(x) == 0:
+        # no spread to resample
+        return (theta, np.nan, np.nan)
+    boot = np.empty(B)
+    step = max(1, chunk // n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for start in range(0, B, step):
+            stop = min(start + step, B)
+            xs = x[rng.integers(0, n, size=(stop - start, n))]
+            boot[start:stop] = ppk(np.mean(xs, axis=1), np.std(xs, axis=1))
+        q = np.array([alpha / 2, 1 - alpha / 2])
+        if method == 'bca':
+            z0 = scipy.stats.norm.ppf(np.mean(boot < theta))
+            # jackknife (leave one out) Ppk from centered sums
+            xc = x - np.mean(x)
+            loo_mean = -xc / (n - 1)
+            loo_var = (np.sum(xc ** 2) - xc ** 2) / (n - 1) - loo_mean ** 2
+            jack = ppk(np.mean(x) + loo_mean, np.sqrt(np.maximum(loo_var, 0)))
+            d = np.mean(jack) - jack
+            acc = np.sum(d ** 3) / (6 * np.sum(d ** 2) ** 1.5)
+            z = scipy.stats.norm.ppf(q)
+            q = scipy.stats.norm.cdf(z0 + (z0 + z) / (1 - acc * (z0 + z)))
+    if not np.all(np.isfinite(q)):
+        # BCa correction undefined (e.g. tiny category with null jackknife spread)
+        return (theta, np.nan, np.nan)
+    lo, hi = np.quantile(boot, q)
+    return (theta, lo, hi)
+
+
+def batch_cpk(dat, cat, sub, val, lsl, usl, sigma='rbar', mul=3):
+    '''
+    Return a dataframe of short term (Cp, Cpk, within subgroups sigma) and
+    long term (Pp, Ppk, overall std) process capability per category
+    (cat, n, subgroups, mu, std, sigma_w, Cp, Cpk, Pp, Ppk). Subgroups ranges
+    and stds are computed with segment reductions over data grouped once.
+    Subgroups of a single value don't contribute to within sigma.
+    dat: long format dataframe
+    cat: category column
+    sub: subgroup column (rational subgroup id, within category)
+    val: value column
+    lsl: Lower Specification Limit
+    usl: Upper Specification Limit
+    sigma: within subgroups sigma estimate, either
+           - rbar - mean of R / d2(n),
+           - sbar - mean of s / c4(n),
+           - pooled - pooled std, unbiased by c4
+    mul: 6 sigma multiplier
+    '''
+    if sigma not in ('rbar', 'sbar', 'pooled'):
+        raise SyntaxError('Unknown within subgroups sigma: %s' % str(sigma))
+    _chk_limits(lsl, usl)
+    ccodes, cats = pd.factorize(dat[cat], use_na_sentinel=False)
+    scodes, subs = pd.factorize(dat[sub], use_na_sentinel=False)
+    gcodes = pd.factorize(ccodes.astype(np.int64) * len(subs) + scodes)[0]
+    x = dat[val].to_numpy(dtype=float)
+    # category of each subgroup
+    gcat = np.empty(gcodes.max() + 1 if len(gcodes) else 0, dtype=np.intp)
+    gcat[gcodes] = ccodes
+    segs = columnar.segments.from_arrays(x, gcodes)
+    n_g, mu_g, s_g = segs.stats(ddof=1)
+    ok = n_g > 1
+    ncat = len(cats)
+    count = lambda w: np.bincount(gcat[ok], weights=w, minlength=ncat)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if sigma == 'rbar':
+            start = segs.offsets[:-1]
+            r_g = np.maximum.reduceat(segs.values, start) - np.minimum.reduceat(segs.values, start)
+            sigma_w = count(r_g[ok] / d2(n_g[ok])) / count(None)
+        elif sigma == 'sbar':
+            sigma_w = count(s_g[ok] / c4(n_g[ok])) / count(None)
+        else:
+            dof = count(n_g[ok] - 1.)
+            sigma_w = np.sqrt(count((n_g[ok] - 1) * s_g[ok] ** 2) / dof) / c4(dof + 1)
+    n, mu, std = columnar.group_stats(ccodes, x, ncat)
+    ret = pd.DataFrame({'cat': cats, 'n': n, 'subgroups': np.bincount(gcat, minlength=ncat),
+                        'mu': mu, 'std': std, 'sigma_w': sigma_w})
+    cp = lambda s: (usl - lsl) / (2 * mul * s) if lsl is not None and usl is not None \
+        else np.full(ncat, np.nan)
+    ret['Cp'] = cp(sigma_w)
+    ret['Cpk'] = ppk_table(pd.DataFrame({'mu': mu, 'std': sigma_w}), lsl, usl, mul)['Ppk']
+    ret['Pp'] = cp(std)
+    ret['Ppk'] = ppk_table(ret[['mu', 'std']], lsl, usl, mul)['Ppk']
+    return ret
+
+
+def d2(n):
+    '''
+    Return d2 unbiasing constant (mean range of n standard normal values)
+    n: subgroup size, scalar or vector (>= 2)
+    '''
+    n = np.asarray(n, dtype=float)
+    sizes, inv = np.unique(n, return_inverse=True)
+    # E(R) = integral of 1 - F(x)**n - (1 - F(x))**n
+    x, dx = np.linspace(-12, 12, 4801, retstep=True)
+    cdf = scipy.stats.norm.cdf(x)
+    ret = np.sum(1 - cdf ** sizes[:, None] - (1 - cdf) ** sizes[:, None], axis=1) * dx
+    return ret[inv].reshape(n.shape)
+
+
+def c4(n):
+    '''
+    Return c4 unbiasing constant (mean of std (ddof=1) of n standard normal
+    values)
+    n: subgroup size, scalar or vector (>= 2)
+    '''
+    n = np.asarray(n, dtype=float)
+    gln = scipy.special.gammaln
+    return np.sqrt(2 / (n - 1)) * np.exp(gln(n / 2) - gln((n - 1) / 2))
+
+
 def plt_ppk(dat, cat, val, lsl, usl, outfile, ppk_target=None, dist='norm'):
     ppks = batch_ppk(dat=dat, cat=cat, val=val, lsl=lsl, usl=usl)
     fig, axes = plt.subplots(1,2, sharey=False)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+
+import numpy as np
+from scipy import stats
+
+class moments():
+
+
+    def __init__(self, lsl=None, usl=None):
+        '''
+        Mergeable running statistics (Welford / Chan) of a stream of values
+        lsl: Lower Spec Limit used to count exceedances
+        usl: Upper Spec Limit used to count exceedances
+        '''
+        self.lsl = lsl
+        self.usl = usl
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.below = 0
+        self.above = 0
+
+
+    def update(self, x):
+        '''
+        Add a batch of values to the statistics
+        x: 1D vector
+        '''
+        x = np.asarray(x, dtype=float)
+        if not len(x):
+            return self
+        n = len(x)
+        mean = np.mean(x)
+        m2 = np.sum((x - mean) ** 2)
+        self.__combine(n, mean, m2)
+        self.min = min(self.min, np.min(x))
+        self.max = max(self.max, np.max(x))
+        if self.lsl is not None:
+            self.below += int(np.count_nonzero(x < self.lsl))
+        if self.usl is not None:
+            self.above += int(np.count_nonzero(x > self.usl))
+        return self
+
+
+    def merge(self, other):
+        '''
+        Merge statistics of another moments object into this one
+        other: moments object built with the same lsl / usl
+        '''
+        if other.lsl != self.lsl or other.usl != self.usl:
+            raise SyntaxError('moments with different lsl / usl can\'t be merged')
+        if not other.n:
+            return self
+        self.__combine(other.n, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.below += other.below
+        self.above += other.above
+        return self
+
+
+    def var(self, ddof=0):
+        '''
+        Return variance of values seen so far
+        ddof: delta degrees of freedom
+        '''
+        if self.n - ddof <= 0:
+            return np.nan
+        return self.m2 / (self.n - ddof)
+
+
+    def std(self, ddof=0):
+        '''
+        Return standard deviation of values seen so far
+        ddof: delta degrees of freedom
+        '''
+        return np.sqrt(self.var(ddof))
+
+
+    def ci(self, metric='mean', alpha=0.05):
+        '''
+        Return half width of the 1 - alpha confidence interval of a statistic
+        metric: either
+                - mean - absolute half width on mean,
+                - std - absolute half width on std (normal approximation),
+                - dppm - half width relative to observed dppm (inf without defects)
+        alpha: confidence
+        '''
+        z = stats.norm.ppf(1 - alpha / 2)
+        if self.n < 2:
+            return np.inf
+        if metric == 'mean':
+            ret = z * self.std(ddof=1) / np.sqrt(self.n)
+        elif metric == 'std':
+            ret = z * self.std(ddof=1) / np.sqrt(2 * (self.n - 1))
+        elif metric == 'dppm':
+            p = (self.below + self.above) / self.n
+            if not p:
+                return np.inf
+            ret = z * np.sqrt((1 - p) / (self.n * p))
+        else:
+            raise SyntaxError('Unknown metric: %s' % str(metric))
+        return ret
+
+
+    def count_dppm(self):
+        '''
+        Return observed defect occurrence (in dppm) beyond lsl and usl
+        '''
+        if not self.n:
+            return np.nan
+        return (self.below + self.above) / self.n * 10**6
+
+
+    def norm_dppm(self):
+        '''
+        Return defect occurrence (in dppm) beyond lsl and usl of the normal
+        law fitted with running mean and std
+        '''
+        ret = 0
+        std = self.std()
+        if self.lsl is not None:
+            ret += stats.norm.cdf(self.lsl, loc=self.mean, scale=std)
+        if self.usl is not None:
+            ret += stats.norm.sf(self.usl, loc=self.mean, scale=std)
+        return ret * 10**6
+
+
+    def __combine(self, n, mean, m2):
+        tot = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / tot
+        self.m2 += m2 + delta ** 2 * self.n * n / tot
+        self.n = tot
+
+
+class comoments():
+
+
+    def __init__(self, lsl=None, usl=None):
+        '''
+        Mergeable running means and co-moments of dimensions draws and of their
+        stackup, with sums of draws beyond lsl / usl (tail-conditional means)
+        lsl: Lower Spec Limit of the stackup
+        usl: Upper Spec Limit of the stackup
+        '''
+        self.lsl = lsl
+        self.usl = usl
+        self.n = 0
+        self.mean = 0.0
+        self.c = 0.0
+        self.tail_n = {'lsl': 0, 'usl': 0}
+        self.tail_sum = {'lsl': 0.0, 'usl': 0.0}
+
+
+    def update(self, x, y):
+        '''
+        Add a batch of draws to the statistics
+        x: (draws x dims) matrix of dimensions draws
+        y: stackup vector of the draws
+        '''
+        z = np.column_stack((x, y))
+        if not len(z):
+            return self
+        mean = np.mean(z, axis=0)
+        dz = z - mean
+        self.__combine(len(z), mean, dz.T @ dz)
+        for key, mask in self.__tails(z[:, -1]):
+            self.tail_n[key] += int(np.count_nonzero(mask))
+            self.tail_sum[key] = self.tail_sum[key] + np.sum(z[mask], axis=0)
+        return self
+
+
+    def merge(self, other):
+        '''
+        Merge statistics of another comoments object into this one
+        other: comoments object built with the same lsl / usl
+        '''
+        if other.lsl != self.lsl or other.usl != self.usl:
+            raise SyntaxError('comoments with different lsl / usl can\'t be merged')
+        if not other.n:
+            return self
+        self.__combine(other.n, other.mean, other.c)
+        for key in self.tail_n:
+            self.tail_n[key] += other.tail_n[key]
+            self.tail_sum[key] = self.tail_sum[key] + other.tail_sum[key]
+        return self
+
+
+    def cov(self, ddof=0):
+        '''
+        Return covariance matrix of dimensions and stackup (last row / column)
+        ddof: delta degrees of freedom
+        '''
+        return self.c / (self.n - ddof)
+
+
+    def tail_mean(self, key):
+        '''
+        Return mean of dimensions and stackup over draws beyond a spec limit
+        key: either lsl or usl
+        '''
+        if not self.tail_n[key]:
+            return np.nan
+        return self.tail_sum[key] / self.tail_n[key]
+
+
+    def __tails(self, y):
+        if self.lsl is not None:
+            yield 'lsl', y < self.lsl
+        if self.usl is not None:
+            yield 'usl', y > self.usl
+
+
+    def __combine(self, n, mean, c):
+        tot = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / tot
+        self.c = self.c + c + np.outer(delta, delta) * self.n * n / tot
+        self.n = tot
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import numpy as np
+from scipy import stats
+import cmp_stkup
+
+def wide_stkup(dims_nb=20):
+    '''
+    Return a stackup of dims_nb normal dimensions used for benchmarks
+    '''
+    dims = []
+    for i in range(dims_nb):
+        direction = 1 if i % 2 else -1
+        dims.append(cmp_stkup.stkup_dim('d%i' % i, direction, 10 + i, 11 + i, Ppk_min=1.33))
+    return cmp_stkup.stkup(*dims)
+
+
+def bench_workers(stk, draws=10**8, workers=None, chunk=10**6, seed=1):
+    '''
+    Time stkup.mc_stream() for each worker count and print speedup / efficiency
+    stk: stkup object
+    draws: number of draws
+    workers: iterable of worker counts (1 to cpu count by powers of 2 if None)
+    '''
+    if workers is None:
+        workers = [2**i for i in range(int(np.log2(os.cpu_count())) + 1)]
+    ref = None
+    for w in workers:
+        start = time.perf_counter()
+        acc = stk.mc_stream(draws=draws, chunk=chunk, seed=seed, workers=w)
+        elapsed = time.perf_counter() - start
+        if ref is None:
+            ref = elapsed * workers[0]
+        speedup = ref / elapsed
+        print('workers %3i - %7.2f s - speedup %5.2f - efficiency %3.0f %% - std %1.5f' %
+              (w, elapsed, speedup, 100 * speedup / w, acc.std()))
+
+
+def bench_samplers(stk, draws=None, reps=20, q=0.99865,
+                   samplers=('random', 'sobol', 'lhs')):
+    '''
+    Print root mean square error of mean, std and q quantile estimated by
+    stkup.monte_carlo() for each sampler and number of draws.
+    stk must only have normal dimensions (exact reference values).
+    stk: stkup object
+    draws: iterable of numbers of draws (powers of 2 from 2**8 to 2**16 if None)
+    reps: number of repetitions used to estimate the error
+    q: quantile level
+    '''
+    if draws is None:
+        draws = [2**i for i in range(8, 17, 2)]
+    mu = np.sum(stk.directions() * np.array([dim.mu_hat for dim in stk.dims]))
+    std = stk.stats('std')
+    ref = np.array([mu, std, stats.norm.ppf(q, loc=mu, scale=std)])
+    print('%-8s %8s %10s %10s %10s' % ('sampler', 'draws', 'rmse mu', 'rmse std', 'rmse q'))
+    for sampler in samplers:
+        for n in draws:
+            err = np.empty((reps, 3))
+            for i in range(reps):
+                pop = stk.monte_carlo(draws=n, seed=i, sampler=sampler)
+                err[i] = np.array([np.mean(pop), np.std(pop), np.quantile(pop, q)]) - ref
+            rmse = np.sqrt(np.mean(err ** 2, axis=0))
+            print('%-8s %8i %10.2e %10.2e %10.2e' % ((sampler, n) + tuple(rmse)))
+
+
+if __name__ == '__main__':
+    stk = wide_stkup()
+    print('Stackup: %s' % stk.name)
+    bench_samplers(stk)
+    bench_workers(stk)
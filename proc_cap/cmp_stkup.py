@@ -1,27 +1,47 @@
 #!/usr/bin/python3
 
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+import hashlib
+import json
+import time
 import numpy as np
-from scipy import stats
+from scipy import stats, optimize
+from scipy.stats import qmc
+from scipy import signal
 import pandas as pd
 import norm_tests
+import accum
+import columnar
+
+# normal scores range of the quantile tables of fitted / empirical dimensions
+_Z_MAX = 8.5
 
 class stkup_dim():
 
     
     def __init__(self, name, direction, lsl, usl, dist='norm',
                  mu_hat=None, std_hat=None, Ppk_min=None,
-                 rnd_size = 10**6):
+                 rnd_size = 10**6, fit=None, tab_size=2**12 + 1):
         '''
         Create a stackup dimension object
         name: dimension name
         direction: dimension direction / coefficient
         lsl: Lower Spec Limit
         usl: Upper Spec Limit
-        dist: either normal, uniform or generalized normal type 1 statistical distributions.
+        dist: either
+              - norm - normal law (mu_hat and std_hat or Ppk_min),
+              - equiprobable - uniform law between lsl and usl,
+              - gennorm - generalized normal law type 1 fitted with fit,
+              - a scipy.stats frozen distribution,
+              - a 1D vector of measured data (empirical distribution)
         mu_hat: estimated mean
         std_hat: estimated standard deviation
         Ppk_min: minimum process capability
         rndm_size: len() of random values
+        fit: (beta, loc, scale) of gennorm law, see thres_ppk.fit_gennorm()
+        tab_size: size of the quantile table used to draw gennorm, scipy
+                  and empirical distributions
         '''
 
         self.name = name
@@ -36,12 +56,25 @@ class stkup_dim():
         self.mu_hat = None
         self.std_hat = None
         self.Ppk_min = None
-        if dist == 'equiprobable':
+        self.__tab = None
+        law = self.__get_law(dist, fit)
+        if law is not None:
+            if mu_hat is not None or std_hat is not None or Ppk_min is not None:
+                raise SyntaxError("Ppk_min, std_hat or mu_hat can\'t be set with a fitted or empirical law")
+            if isinstance(law, np.ndarray):
+                self.dist = 'empirical'
+                mu_hat, std_hat = np.mean(law), np.std(law)
+            else:
+                self.dist = law.dist.name
+                mu_hat, std_hat = law.mean(), law.std()
+            if self.dist != 'norm':
+                self.__tab = self.__quantile_table(law, tab_size)
+        if self.dist == 'equiprobable':
             if std_hat or Ppk_min:
                 raise SyntaxError("Ppk_min, std_hat or mu_hat can\'t be set with equiprobable law")
             self.std_hat = self.__calc_std()
         if std_hat:
-            if PPk_min:
+            if Ppk_min:
                 self.__err_ppk_std()
             self.std_hat = std_hat
         if Ppk_min:
@@ -49,7 +82,7 @@ class stkup_dim():
                 self.__err_ppk_std()
             self.Ppk_min = Ppk_min
             self.std_hat = self.__calc_std()
-        if not mu_hat:
+        if mu_hat is None:
             self.mu_hat = self.__calc_nom()
         else:
             self.mu_hat = mu_hat
@@ -72,10 +105,41 @@ class stkup_dim():
                 print('off center mean not supported')
                 pass
             ret = abs(self.usl - self.nominal) / (3 * self.Ppk_min)
-        elif dist == 'gennorm':
-            pass
         return ret        
 
+
+    def __get_law(self, dist, fit):
+        if isinstance(dist, str):
+            if dist == 'gennorm':
+                if fit is None:
+                    raise SyntaxError('gennorm law needs fit=(beta, loc, scale)')
+                return stats.gennorm(*fit)
+            if dist not in ('norm', 'equiprobable'):
+                raise SyntaxError('Unknown statistical law: %s' % dist)
+            return None
+        if hasattr(dist, 'ppf') and hasattr(dist, 'cdf'):
+            return dist
+        ret = np.sort(np.asarray(dist, dtype=float))
+        if ret.ndim != 1 or len(ret) < 2:
+            raise SyntaxError('empirical law needs a 1D vector of at least 2 values')
+        return ret
+
+
+    def __quantile_table(self, law, tab_size):
+        # quantiles at evenly spaced normal scores: drawing is a direct lookup
+        z = np.linspace(-_Z_MAX, _Z_MAX, tab_size)
+        if isinstance(law, np.ndarray):
+            return np.quantile(law, stats.norm.cdf(z))
+        return law.ppf(stats.norm.cdf(z))
+
+
+    def __tab_lookup(self, z):
+        step = 2 * _Z_MAX / (len(self.__tab) - 1)
+        pos = (np.clip(z, -_Z_MAX, _Z_MAX) + _Z_MAX) / step
+        idx = np.minimum(pos.astype(np.intp), len(self.__tab) - 2)
+        lo = self.__tab[idx]
+        return lo + (pos - idx) * (self.__tab[idx + 1] - lo)
+
     
     def rndm_scal(self):
         ''' 
@@ -87,6 +151,69 @@ class stkup_dim():
             ret = stats.norm.rvs(loc=self.mu_hat, scale=self.std_hat)
         elif self.dist == 'equiprobable':
             ret = stats.uniform.rvs(loc=self.lsl, scale=self.usl - self.lsl)
+        else:
+            ret = float(self.from_normal(stats.norm.rvs()))
+        return ret
+
+
+    def rndm_vec(self, size, rng=None):
+        '''
+        Return a vector of random values based on the location / scale given at creation
+        size: number of values to draw
+        rng: numpy Generator, SeedSequence or integer seed (fresh entropy if None)
+        '''
+        rng = np.random.default_rng(rng)
+        if self.dist == 'norm':
+            if not self.mu_hat and not self.std_hat:
+                raise SyntaxError('mean and std or Ppk  must be specified to draw random number')
+            ret = rng.normal(loc=self.mu_hat, scale=self.std_hat, size=size)
+        elif self.dist == 'equiprobable':
+            ret = rng.uniform(low=self.lsl, high=self.usl, size=size)
+        else:
+            ret = self.from_normal(rng.standard_normal(size))
+        return ret
+
+
+    def ppf(self, u):
+        '''
+        Map uniform values in ]0, 1[ to the dimension distribution (inverse CDF)
+        u: uniform values
+        '''
+        if self.dist == 'norm':
+            ret = stats.norm.ppf(u, loc=self.mu_hat, scale=self.std_hat)
+        elif self.dist == 'equiprobable':
+            ret = self.lsl + (self.usl - self.lsl) * np.asarray(u)
+        else:
+            ret = self.from_normal(stats.norm.ppf(u))
+        return ret
+
+
+    def cdf(self, x):
+        '''
+        Return the cumulative distribution function of the dimension at x
+        x: values
+        '''
+        if self.dist == 'norm':
+            ret = stats.norm.cdf(x, loc=self.mu_hat, scale=self.std_hat)
+        elif self.dist == 'equiprobable':
+            ret = np.clip((np.asarray(x) - self.lsl) / (self.usl - self.lsl), 0, 1)
+        else:
+            z = np.linspace(-_Z_MAX, _Z_MAX, len(self.__tab))
+            ret = stats.norm.cdf(np.interp(x, self.__tab, z))
+        return ret
+
+
+    def from_normal(self, z):
+        '''
+        Map standard normal values to the dimension distribution: F^-1(Phi(z))
+        z: standard normal values
+        '''
+        if self.dist == 'norm':
+            ret = self.mu_hat + self.std_hat * np.asarray(z)
+        elif self.dist == 'equiprobable':
+            ret = self.lsl + (self.usl - self.lsl) * stats.norm.cdf(z)
+        else:
+            ret = self.__tab_lookup(np.asarray(z))
         return ret
 
     
@@ -97,9 +224,11 @@ class stkup_dim():
 class stkup():
     
     
-    def __init__(self, *dims):
+    def __init__(self, *dims, corr=None):
         '''
         *dims: stkup_dim objects 
+        corr: correlation matrix of the dimensions (independent if None),
+              non normal dimensions are correlated through a gaussian copula
         '''
         self.name = ''
         i = 0
@@ -109,6 +238,18 @@ class stkup():
             i += 1
         self.dims = dims
         self.nominal = self.nominal()
+        self.corr = None
+        self.chol = None
+        if corr is not None:
+            self.corr = np.array(corr, dtype=float)
+            if self.corr.shape != (len(dims), len(dims)) or \
+               not np.allclose(self.corr, self.corr.T) or \
+               not np.allclose(np.diag(self.corr), 1):
+                raise SyntaxError('corr must be a symmetric correlation matrix with one row per dimension')
+            try:
+                self.chol = np.linalg.cholesky(self.corr)
+            except np.linalg.LinAlgError:
+                raise SyntaxError('corr must be positive definite')
 
         
     def get_inputs(self):
@@ -131,31 +272,71 @@ class stkup():
         return pd.DataFrame(ret).transpose()
     
                         
-    def compare(self, lsl=None, usl=None):
+    def compare(self, lsl=None, usl=None, draws=None, chunk=10**6, workers=1,
+                seed=None, sampler='random', precision=0.1, max_draws=10**7,
+                verbose=True):
         '''
         Compare different stackup options
+        Return a stkup_result object (figures, draws, seed and stage timings)
+        lsl: Lower Specification Limit of the stackup
+        usl: Upper Specification Limit of the stackup
+        draws: number of Monte Carlo draws, streamed by chunks of chunk draws.
+               If None, draws are adapted with mc_adaptive() until relative
+               precision is met on dppm (lsl / usl set) or on std, within
+               max_draws
+        workers: number of processes sharing the Monte Carlo draws
+        seed: seed of the Monte Carlo random generator (drawn and recorded if None)
+        sampler: Monte Carlo sampler, random, sobol or lhs
+        precision: relative half width of the 95 % confidence interval on dppm
+                   or std targeted when draws is None
+        max_draws: maximum number of draws when draws is None
+        verbose: if True, print the result (see stkup_result.render())
         '''
-        print('Stackup: %s ' % self.name)
-        print('Nominal: %1.3f' % self.nominal)
-        print('Worst case - min: %1.3f, max: %1.3f' % self.worst_case())
-        tol_ti = self.stats('ti')
-        print('Statistical (tolerance interval) - mu %1.3f, s %1.3f' %
-              (self.nominal, tol_ti))
-        tol_ppk = self.stats('std')
-        print('Statistical (std) - mu %1.3f, s %1.3f' %
-              (self.nominal, tol_ppk))
-        if lsl or usl:
-            stat_pop = stats.norm.rvs(loc=self.nominal, scale=tol_ppk, size = 10**4)
-            print('Statistical (std) - defects: %6.2f' % 
-                  self.calc_dppm(stat_pop, lsl=lsl, usl=usl))
-        mc_pop = self.monte_carlo()
-        mc_pop_std = np.std(mc_pop)
-        mc_pop_mu = np.mean(mc_pop)
-        print('Monte Carlo - mu %1.3f, std %1.3f' %
-              (mc_pop_mu, mc_pop_std))
-        if lsl or usl:
-            print('Statistical (Monte Carlo) - defects: %6.2f' % 
-                  self.calc_dppm(mc_pop, lsl=lsl, usl=usl))
+        specs = lsl is not None or usl is not None
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        ret = stkup_result(name=self.name, nominal=self.nominal, lsl=lsl, usl=usl,
+                           seed=seed, sampler=sampler, workers=workers)
+        start = time.perf_counter()
+        ret.wc_min, ret.wc_max = self.worst_case()
+        ret.timings['worst_case'] = time.perf_counter() - start
+        start = time.perf_counter()
+        ret.ti = self.stats('ti')
+        ret.std = self.stats('std')
+        if specs:
+            ret.std_dppm = dppm_eval.from_norm(self.nominal, ret.std)(lsl=lsl, usl=usl)
+        ret.timings['rss'] = time.perf_counter() - start
+        start = time.perf_counter()
+        if draws is None:
+            if specs:
+                ret.mc_metric, target = 'dppm', precision
+            else:
+                ret.mc_metric, target = 'std', precision * ret.std
+            mc, ret.mc_precision = self.mc_adaptive(target, metric=ret.mc_metric, lsl=lsl,
+                                                    usl=usl, max_draws=max_draws, seed=seed,
+                                                    chunk=chunk, workers=workers,
+                                                    sampler=sampler)
+        else:
+            mc = self.mc_stream(draws=draws, lsl=lsl, usl=usl, chunk=chunk,
+                                workers=workers, seed=seed, sampler=sampler)
+        ret.mc_draws = mc.n
+        ret.mc_mu = mc.mean
+        ret.mc_std = mc.std()
+        if specs:
+            ret.mc_norm_dppm = mc.norm_dppm()
+            ret.mc_count_dppm = mc.count_dppm()
+        ret.timings['monte_carlo'] = time.perf_counter() - start
+        if self.corr is None:
+            start = time.perf_counter()
+            conv = self.convolve()
+            ret.conv_mu = np.sum(conv['x'] * conv['pmf'])
+            ret.conv_std = np.sqrt(np.sum((conv['x'] - ret.conv_mu) ** 2 * conv['pmf']))
+            if specs:
+                ret.conv_dppm = self.conv_dppm(lsl=lsl, usl=usl, conv=conv)
+            ret.timings['convolution'] = time.perf_counter() - start
+        if verbose:
+            ret.render()
+        return ret
         
               
     def worst_case(self):
@@ -190,65 +371,550 @@ class stkup():
         stk: either-
              - ti - tolerance interval,
              - std - observed standard deviation, 
+        covariance terms are included for correlated dimensions
         '''
-        ret = 0
+        if stk == 'ti':
+            spread = np.array([(dim.usl - dim.lsl) / 2 for dim in self.dims])
+        elif stk == 'std':
+            spread = np.array([dim.std_hat for dim in self.dims])
+        else:
+            raise SyntaxError('Unknown statistical stackup: %s' % str(stk))
+        spread = spread * self.directions()
+        if self.corr is None:
+            return np.sqrt(np.sum(spread ** 2))
+        return np.sqrt(spread @ self.corr @ spread)
+
+
+    def to_variant(self):
+        '''
+        Return stackup inputs as a one row variants table for batch_stkup()
+        '''
+        ret = {}
         for dim in self.dims:
-            if stk == 'ti':
-                ti = (dim.usl - dim.lsl) / 2
-                ret += ti ** 2
-            elif stk == 'std':
-                ret += dim.std_hat ** 2
+            ret[(dim.name, 'direction')] = [dim.direction]
+            ret[(dim.name, 'lsl')] = [dim.lsl]
+            ret[(dim.name, 'usl')] = [dim.usl]
+            ppk = np.nan
+            if dim.dist != 'equiprobable':
+                ppk = abs(dim.usl - dim.nominal) / (3 * dim.std_hat)
+            ret[(dim.name, 'Ppk_min')] = [ppk]
+        return pd.DataFrame(ret)
+
+
+    def directions(self):
+        '''
+        Return dimensions directions / coefficients as a vector
+        '''
+        return np.array([dim.direction for dim in self.dims], dtype=float)
+
+
+    def draw_matrix(self, draws, rng=None, engine=None):
+        '''
+        Return a (draws x dims) matrix of random values, one column per dimension
+        draws: number of draws
+        rng: numpy Generator, SeedSequence or integer seed
+        engine: scipy.stats.qmc engine providing the uniforms (pseudo-random
+                draws if None), see sampler_engine()
+        '''
+        ret = np.empty((draws, len(self.dims)), order='F')
+        if self.chol is not None:
+            if engine is None:
+                z = np.random.default_rng(rng).standard_normal((draws, len(self.dims)))
             else:
-                raise SyntaxError('Unknown statistical stackup: %s' % str(stk))
-        return np.sqrt(ret)
+                z = stats.norm.ppf(engine.random(draws))
+            z = z @ self.chol.T
+            for j, dim in enumerate(self.dims):
+                ret[:, j] = dim.from_normal(z[:, j])
+        elif engine is None:
+            rng = np.random.default_rng(rng)
+            for j, dim in enumerate(self.dims):
+                ret[:, j] = dim.rndm_vec(draws, rng=rng)
+        else:
+            u = engine.random(draws)
+            for j, dim in enumerate(self.dims):
+                ret[:, j] = dim.ppf(u[:, j])
+        return ret
+
+
+    def sampler_engine(self, sampler='random', rng=None):
+        '''
+        Return the scipy.stats.qmc engine used to draw the dimensions uniforms
+        sampler: either
+                 - random - pseudo-random draws (no engine, None is returned),
+                 - sobol - scrambled Sobol sequence,
+                 - lhs - Latin hypercube design
+        rng: numpy Generator, SeedSequence or integer seed used for scrambling
+        '''
+        if sampler == 'random':
+            ret = None
+        elif sampler == 'sobol':
+            ret = qmc.Sobol(d=len(self.dims), scramble=True, seed=rng)
+        elif sampler == 'lhs':
+            ret = qmc.LatinHypercube(d=len(self.dims), seed=rng)
+        else:
+            raise SyntaxError('Unknown sampler: %s' % str(sampler))
+        return ret
 
     
-    def monte_carlo(self, draws = 10**4):
+    def monte_carlo(self, draws = 10**4, seed=None, chunk=10**6, workers=1,
+                    sampler='random', store=None):
         '''
-        Stackup Monte Carlo simulation
+        Stackup Monte Carlo simulation, returned as a vector of draws values
         draws: number of draws for simulation
+        seed: seed of the random generator (fresh entropy if None)
+        chunk: maximum number of rows of the draw matrix held at once
+        workers: number of processes sharing the draws
+        sampler: random, sobol or lhs (see sampler_engine()). Sobol balance
+                 properties require powers of 2 for draws and chunk
+        store: mc_store.mc_store object. Simulations are written to / reused
+               from the store as read-only memory maps (seed needed)
         '''
-        cnt = 0
-        ret = []
-        for i in range(draws):
-            stk = 0
-            for dim in self.dims:
-                stk += dim.direction * dim.rndm_scal()
-            ret.append(stk)
+        # fail before spawning workers on unknown sampler
+        self.sampler_engine(sampler)
+        if store is None:
+            parts = self.__run_workers(_mc_pop, draws, seed, workers, chunk, sampler, None)
+            return np.concatenate(parts)
+        if seed is None:
+            raise SyntaxError('seed needed to store simulations')
+        key = store.key(self.fingerprint(), draws, seed, workers, chunk, sampler)
+        ret = store.load(key)
+        if ret is None:
+            path = store.create(key, draws)
+            self.__run_workers(_mc_pop, draws, seed, workers, chunk, sampler, path)
+            ret = store.commit(key)
         return ret
 
 
-    def calc_dppm(self, pop, lsl=None, usl=None, dist='norm', pval=True):
+    def fingerprint(self):
         '''
-        Return total defect occurrence (in dppm) for data using lsl and usl
-        pop: sample
+        Return a digest of the stackup inputs, dimensions laws and correlations
+        '''
+        ret = hashlib.sha1(self.get_inputs().to_csv().encode())
+        probe = np.linspace(-8, 8, 65)
+        for dim in self.dims:
+            ret.update(np.asarray(dim.from_normal(probe), dtype=float).tobytes())
+        if self.corr is not None:
+            ret.update(self.corr.tobytes())
+        return ret.hexdigest()
+
+
+    def mc_stream(self, draws=10**6, lsl=None, usl=None, seed=None, chunk=10**6,
+                  workers=1, sampler='random', contrib=False):
+        '''
+        Streamed stackup Monte Carlo simulation: draws are generated by chunks
+        and only running statistics are kept (memory does not depend on draws)
+        Return an accum.moments object (n, mean, std, min, max, exceedances),
+        or (accum.moments, accum.comoments) if contrib is set to True
+        draws: number of draws for simulation
+        lsl: Lower Specification Limit used to count defects
+        usl: Upper Specification Limit used to count defects
+        seed: seed of the random generator (fresh entropy if None)
+        chunk: number of draws generated at once
+        workers: number of processes sharing the draws
+        sampler: random, sobol or lhs (see sampler_engine())
+        contrib: if True, also stream dimensions co-moments for contributions()
+        '''
+        # fail before spawning workers on unknown sampler
+        self.sampler_engine(sampler)
+        parts = self.__run_workers(_mc_stats, draws, seed, workers, chunk,
+                                   sampler, lsl, usl, contrib)
+        ret = accum.moments(lsl=lsl, usl=usl)
+        co = accum.comoments(lsl=lsl, usl=usl)
+        for part, part_co in parts:
+            ret.merge(part)
+            if contrib:
+                co.merge(part_co)
+        if contrib:
+            return (ret, co)
+        return ret
+
+
+    def mc_adaptive(self, precision, metric='mean', lsl=None, usl=None, alpha=0.05,
+                    start=10**4, max_draws=10**8, seed=None, chunk=10**6,
+                    workers=1, sampler='random'):
+        '''
+        Streamed stackup Monte Carlo simulation running until the 1 - alpha
+        confidence interval of metric is narrow enough. Rounds of draws grow
+        geometrically (at most doubling the draws) up to max_draws.
+        Return (accum.moments, achieved half width), draws used being the
+        moments n
+        precision: target half width, absolute for mean / std, relative for dppm
+        metric: mean, std or dppm (see accum.moments.ci())
+        lsl: Lower Specification Limit used to count defects
+        usl: Upper Specification Limit used to count defects
+        alpha: confidence
+        start: number of draws of the first round
+        max_draws: maximum number of draws
+        seed: seed of the random generator (fresh entropy if None)
+        chunk, workers, sampler: see mc_stream(). With sobol sampler, chunk
+                                 and draws per worker of each round are
+                                 powers of 2 (sequence balance)
+        '''
+        if metric == 'dppm' and lsl is None and usl is None:
+            raise SyntaxError('LSL and / or USL needed')
+        if precision <= 0:
+            raise SyntaxError('precision must be strictly positive')
+        if start <= 0 or max_draws <= 0:
+            raise SyntaxError('start and max_draws must be strictly positive')
+        sobol = sampler == 'sobol'
+        if sobol:
+            chunk = 2 ** int(np.ceil(np.log2(chunk)))
+        seed = np.random.SeedSequence(seed)
+        ret = accum.moments(lsl=lsl, usl=usl)
+        half = np.inf
+        size = min(start, max_draws)
+        while size > 0:
+            if sobol:
+                size = _sobol_draws(size, max_draws - ret.n, workers)
+                if not size:
+                    break
+            ret.merge(self.mc_stream(draws=size, lsl=lsl, usl=usl, seed=seed.spawn(1)[0],
+                                     chunk=chunk, workers=workers, sampler=sampler))
+            half = ret.ci(metric, alpha)
+            if half <= precision:
+                break
+            # draws needed from the current estimate, without more than doubling
+            needed = ret.n * 2
+            if np.isfinite(half):
+                needed = ret.n * (half / precision) ** 2 * 1.1
+            size = int(min(max(needed - ret.n, start), ret.n, max_draws - ret.n))
+        return (ret, half)
+
+
+    def contributions(self, co):
+        '''
+        Return a dataframe of dimensions contributions to the stackup, from the
+        co-moments of a single simulation (mc_stream(contrib=True)):
+        - var_pct - share of stackup variance (percent),
+        - corr - correlation between dimension and stackup,
+        - lsl_pct / usl_pct - share of the mean stackup shift of draws beyond
+          lsl / usl (percent), i.e. dimensions driving defects
+        co: accum.comoments object
+        '''
+        coefs = self.directions()
+        cov = co.cov()
+        var_y = cov[-1, -1]
+        ret = pd.DataFrame({'name': [dim.name for dim in self.dims]})
+        ret['var_pct'] = 100 * coefs * cov[:-1, -1] / var_y
+        ret['corr'] = cov[:-1, -1] / np.sqrt(np.diag(cov)[:-1] * var_y)
+        for key in ('lsl', 'usl'):
+            shift = co.tail_mean(key) - co.mean
+            ret[key + '_pct'] = 100 * coefs * shift[:-1] / shift[-1]
+        return ret
+
+
+    def dppm_is(self, lsl=None, usl=None, draws=10**5, seed=None, chunk=10**6):
+        '''
+        Rare event defect occurrence (in dppm) estimated by importance sampling.
+        Dimensions are drawn through standard normal scores centred on the
+        design point of each spec limit (most likely failure point, found by
+        constrained minimization), mixed with a share of unshifted draws, and
+        draws are reweighted by their likelihood ratio.
+        Return a dict {'lsl': (dppm, std err), 'usl': (...), 'total': (...)}
+        lsl: Lower Specification Limit of the stackup
+        usl: Upper Specification Limit of the stackup
+        draws: number of draws per spec limit
+        seed: seed of the random generator (fresh entropy if None)
+        chunk: number of draws generated at once
+        '''
+        if lsl is None and usl is None:
+            raise SyntaxError('LSL and / or USL needed')
+        if lsl is not None and usl is not None:
+            self.__must_be_sup(lsl, usl)
+        rng = np.random.default_rng(seed)
+        ret = {'lsl': (0.0, 0.0), 'usl': (0.0, 0.0)}
+        for key, limit, sign in (('lsl', lsl, -1), ('usl', usl, 1)):
+            if limit is not None:
+                ret[key] = self.__is_tail(limit, sign, draws, rng, chunk)
+        ret['total'] = (ret['lsl'][0] + ret['usl'][0],
+                        np.sqrt(ret['lsl'][1] ** 2 + ret['usl'][1] ** 2))
+        return ret
+
+
+    def convolve(self, npts=2**16, z_max=8):
+        '''
+        Exact stackup distribution by numerical convolution (FFT) of the scaled
+        dimensions distributions discretized on a shared grid.
+        Return a dataframe with grid points x and the pmf (probability of the
+        grid cell), pdf, cdf and sf (survival function) of the stackup at x
+        npts: approximate number of grid points of the stackup distribution
+        z_max: dimensions supports are truncated at +/- z_max normal scores
+        '''
+        if self.corr is not None:
+            raise NotImplementedError('convolution of correlated dimensions')
+        coefs = self.directions()
+        bounds = []
+        for dim, coef in zip(self.dims, coefs):
+            bounds.append(np.sort(coef * dim.from_normal(np.array([-z_max, z_max]))))
+        h = np.sum([hi - lo for lo, hi in bounds]) / npts
+        pmf = np.ones(1)
+        offset = 0
+        for dim, coef, (lo, hi) in zip(self.dims, coefs, bounds):
+            k0 = int(np.floor(lo / h))
+            k1 = int(np.ceil(hi / h))
+            edges = (np.arange(k0, k1 + 2) - 0.5) * h
+            mass = np.diff(dim.cdf(edges / coef))
+            if coef < 0:
+                mass = -mass
+            pmf = signal.fftconvolve(pmf, mass)
+            offset += k0
+        pmf = np.clip(pmf, 0, None)
+        x = (offset + np.arange(len(pmf))) * h
+        # mid-cell cumulated probabilities, summed from each end to keep tails accurate
+        cdf = np.cumsum(pmf) - pmf / 2
+        sf = np.cumsum(pmf[::-1])[::-1] - pmf / 2
+        return pd.DataFrame({'x': x, 'pmf': pmf, 'pdf': pmf / h, 'cdf': cdf, 'sf': sf})
+
+
+    def conv_dppm(self, lsl=None, usl=None, npts=2**16, conv=None):
+        '''
+        Return total defect occurrence (in dppm) beyond lsl and usl
+        of the stackup distribution computed by convolve()
         lsl: Lower Specification Limit
         usl: Upper Specification Limit
-        dist: distribution to be used (normal)
-        pval: if True, assess normality of data with dist
+        npts: approximate number of grid points of the stackup distribution
+        conv: convolve() output to be reused (computed if None)
         '''
-        ret = 0
-        usl_dppm = 0
-        lsl_dppm = 0
-        if lsl != None and usl != None:
+        if lsl is not None and usl is not None:
             self.__must_be_sup(lsl, usl)
-        if dist == 'norm':
-            if pval:
-                print('Anderson Darling normality p-value: %1.3f' % norm_tests.AD(pop))
-            mu_hat, std_hat = stats.norm.fit(pop)
-            if usl:
-                usl_dppm = 1.0 - stats.norm.cdf(usl, loc=mu_hat, scale=std_hat)
-            if lsl:
-                usl_dppm = 1.0 - stats.norm.cdf(lsl, loc=mu_hat, scale=std_hat)
+        if conv is None:
+            conv = self.convolve(npts=npts)
+        ret = 0
+        if lsl is not None:
+            ret += np.interp(lsl, conv['x'], conv['cdf'])
+        if usl is not None:
+            ret += np.interp(usl, conv['x'], conv['sf'])
+        return ret * 10**6
+
+
+    def allocate(self, lsl, usl, dppm, weights=None, k=1, method='rss', npts=2**12,
+                 draws=10**5, seed=None):
+        '''
+        Cheapest tolerance allocation meeting a stackup defect occurrence target.
+        Dimensions keep their nominal, distribution and std / tolerance ratio,
+        tolerance half-widths t are allocated to minimize sum(weights / t**k).
+        The allocation shape is the optimum under the RSS constraint, its scale
+        is searched with analytic (rss) or convolution (conv) evaluations and
+        the final allocation is checked by importance sampling Monte Carlo.
+        Return (stkup, allocation dataframe, dppm_is() output)
+        lsl: Lower Specification Limit of the stackup
+        usl: Upper Specification Limit of the stackup
+        dppm: target defect occurrence (in dppm)
+        weights: cost weight of each dimension, dict by name or list (1 if None)
+        k: cost-tolerance exponent
+        method: either rss (normal stackup) or conv (convolve())
+        npts: number of grid points of convolution evaluations
+        draws: number of draws of the Monte Carlo check
+        seed: seed of the Monte Carlo check
+        '''
+        self.__must_be_sup(lsl, usl)
+        if not lsl < self.nominal < usl:
+            raise SyntaxError('stackup nominal must be within lsl and usl')
+        if not 0 < dppm < 10**6:
+            raise SyntaxError('target dppm must be within ]0, 10**6[')
+        if method not in ('rss', 'conv'):
+            raise SyntaxError('Unknown allocation method: %s' % str(method))
+        if any(dim.dist not in ('norm', 'equiprobable') for dim in self.dims):
+            raise NotImplementedError('allocation of fitted or empirical dimensions')
+        if weights is None:
+            weights = np.ones(len(self.dims))
+        elif isinstance(weights, dict):
+            weights = np.array([weights[dim.name] for dim in self.dims], dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        half = np.array([(dim.usl - dim.lsl) / 2 for dim in self.dims])
+        # std / half tolerance ratio of each dimension
+        ratio = np.array([dim.std_hat for dim in self.dims]) / half
+        sens = (self.directions() * ratio) ** 2
+        shape = (k * weights / sens) ** (1 / (k + 2))
+        if method == 'rss':
+            mu = self.nominal
+            def scaled_dppm(scale):
+                spread = self.directions() * ratio * scale * shape
+                if self.corr is None:
+                    std = np.sqrt(np.sum(spread ** 2))
+                else:
+                    std = np.sqrt(spread @ self.corr @ spread)
+                return (stats.norm.cdf(lsl, mu, std) + stats.norm.sf(usl, mu, std)) * 10**6
         else:
-            raise SyntaxError('dist not supported')
-        ret = (lsl_dppm + usl_dppm) * 10**6
+            def scaled_dppm(scale):
+                stk = self.__scaled_stkup(scale * shape, ratio)
+                return stk.conv_dppm(lsl=lsl, usl=usl, npts=npts)
+        gap = lambda log_scale: np.log(max(scaled_dppm(np.exp(log_scale)), 1e-300)) - np.log(dppm)
+        # bracket log scale, within exp() range (|log scale| <= 512)
+        lo, hi = -1.0, 1.0
+        for _ in range(10):
+            if gap(lo) <= 0:
+                break
+            lo *= 2
+        else:
+            raise SyntaxError('target dppm not reached by tightening tolerances')
+        for _ in range(10):
+            if gap(hi) >= 0:
+                break
+            hi *= 2
+        else:
+            raise SyntaxError('target dppm not reached by widening tolerances')
+        tol = np.exp(optimize.brentq(gap, lo, hi, xtol=1e-6)) * shape
+        ret = self.__scaled_stkup(tol, ratio)
+        alloc = pd.DataFrame({'name': [dim.name for dim in ret.dims],
+                              'lsl': [dim.lsl for dim in ret.dims],
+                              'usl': [dim.usl for dim in ret.dims],
+                              'tol': tol,
+                              'std_hat': [dim.std_hat for dim in ret.dims],
+                              'cost': weights / tol ** k})
+        check = ret.dppm_is(lsl=lsl, usl=usl, draws=draws, seed=seed)
+        return (ret, alloc, check)
+
+
+    def calc_dppm(self, pop, lsl=None, usl=None, dist='norm', pval=False):
+        '''
+        Return total defect occurrence (in dppm) for data using lsl and usl
+        pop: sample, or columnar.segments (vector of dppm per category, with
+             scalar limits)
+        lsl: Lower Specification Limit, scalar or vector (NaN for no limit)
+        usl: Upper Specification Limit, scalar or vector (NaN for no limit)
+        dist: either norm (fitted normal law) or empirical (observed defects,
+              counted in a single pass for scalar limits, e.g. on a
+              memory-mapped population), see dppm_eval
+        pval: if True, return (dppm, Anderson-Darling normality p-value of pop)
+        '''
+        if isinstance(pop, columnar.segments):
+            return self.__seg_dppm(pop, lsl, usl, dist, pval)
+        if dist == 'empirical' and np.ndim(lsl) == 0 and np.ndim(usl) == 0:
+            _chk_limits(lsl, usl)
+            # no copy of arrays / memory maps
+            pop = np.asarray(pop)
+            ret = 0
+            if lsl is not None:
+                ret += np.count_nonzero(pop < lsl)
+            if usl is not None:
+                ret += np.count_nonzero(pop > usl)
+            ret = ret / len(pop) * 10**6
+        else:
+            ret = dppm_eval(pop, dist=dist)(lsl=lsl, usl=usl)
+        if pval:
+            return (ret, norm_tests.AD(pop))
         return ret
                 
         
+    def __seg_dppm(self, segs, lsl, usl, dist, pval):
+        _chk_limits(lsl, usl)
+        if dist == 'empirical':
+            out = np.zeros(len(segs.values), dtype=bool)
+            if lsl is not None:
+                out |= segs.values < lsl
+            if usl is not None:
+                out |= segs.values > usl
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ret = segs.sums(out.astype(float)) / segs.n * 10**6
+        elif dist == 'norm':
+            n, mu, std = segs.stats()
+            ret = dppm_eval.from_norm(mu, std)(lsl=lsl, usl=usl)
+        else:
+            raise SyntaxError('dist not supported')
+        if pval:
+            return (ret, np.array([norm_tests.AD(seg) for seg in segs]))
+        return ret
+
+
     def __must_be_sup(self, mini, maxi):
         if mini >= maxi:
             raise SyntaxError('mini must be strictly inferior to maxi')
+
+
+    def __scaled_stkup(self, tol, ratio):
+        dims = []
+        for dim, t, r in zip(self.dims, tol, ratio):
+            if dim.dist == 'equiprobable':
+                dims.append(stkup_dim(dim.name, dim.direction, dim.nominal - t,
+                                      dim.nominal + t, dist='equiprobable'))
+            else:
+                dims.append(stkup_dim(dim.name, dim.direction, dim.nominal - t,
+                                      dim.nominal + t, dist=dim.dist,
+                                      Ppk_min=1 / (3 * r)))
+        return stkup(*dims, corr=self.corr)
+
+
+    def __stk_from_normal(self, z):
+        if self.chol is not None:
+            z = z @ self.chol.T
+        ret = 0
+        for j, dim in enumerate(self.dims):
+            ret = ret + dim.direction * dim.from_normal(z[..., j])
+        return ret
+
+
+    def __is_tail(self, limit, sign, draws, rng, chunk, defensive=0.1):
+        center = self.__design_point(limit, sign)
+        if center is None:
+            # limit out of reach of the stackup
+            return (0.0, 0.0)
+        tot = 0.0
+        tot2 = 0.0
+        for start in range(0, draws, chunk):
+            n = min(chunk, draws - start)
+            # defensive mixture: a share of draws stays on the nominal law,
+            # bounding likelihood ratios if the failure region is missed
+            z = rng.standard_normal((n, len(self.dims)))
+            z[rng.random(n) >= defensive] += center
+            defect = sign * (self.__stk_from_normal(z) - limit) > 0
+            ratio = np.exp(z[defect] @ center - center @ center / 2)
+            wgt = 1 / (defensive + (1 - defensive) * ratio)
+            tot += np.sum(wgt)
+            tot2 += np.sum(wgt ** 2)
+        p = tot / draws
+        se = np.sqrt(max(tot2 / draws - p ** 2, 0) / draws)
+        return (float(p * 10**6), float(se * 10**6))
+
+
+    def __design_point(self, limit, sign):
+        '''
+        Return the most likely failure point in normal scores space (minimum
+        norm z with stackup(z) = limit), None if limit is out of reach
+        '''
+        gap = lambda z: sign * (self.__stk_from_normal(z) - limit)
+        zero = np.zeros(len(self.dims))
+        if gap(zero) >= 0:
+            return zero
+        # dimensions are monotonic in their scores: farthest reachable point
+        far = sign * np.sign(self.directions()) * _Z_MAX
+        if self.chol is not None:
+            far = np.linalg.solve(self.chol, far)
+        if gap(far) < 0:
+            return None
+        # start on the segment to the linearized design point if reachable,
+        # to the farthest point otherwise
+        shift = self.directions() * np.array([dim.std_hat for dim in self.dims])
+        if self.chol is not None:
+            shift = self.chol.T @ shift
+        shift *= sign * np.sqrt(np.sum(far ** 2) / np.sum(shift ** 2))
+        line = shift if gap(shift) >= 0 else far
+        start = optimize.brentq(lambda t: gap(t * line), 0, 1) * line
+        res = optimize.minimize(lambda z: z @ z, start, jac=lambda z: 2 * z, method='SLSQP',
+                                constraints=[{'type': 'eq', 'fun': gap}])
+        if res.success and res.x @ res.x < start @ start \
+           and abs(gap(res.x)) <= 1e-6 * (1 + abs(limit)):
+            return res.x
+        return start
+
+
+    def __run_workers(self, func, draws, seed, workers, *args):
+        # one independent stream per worker, spawned from a single SeedSequence,
+        # so that results only depend on seed and workers
+        if not isinstance(workers, int) or workers < 1:
+            raise SyntaxError('workers must be a strictly positive integer')
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        seeds = seed.spawn(workers)
+        sizes = [draws // workers + (i < draws % workers) for i in range(workers)]
+        # index of the first draw of each worker
+        starts = np.cumsum([0] + sizes[:-1]).tolist()
+        if workers == 1:
+            return [func(self, sizes[0], seeds[0], 0, *args)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futs = [pool.submit(func, self, size, sq, first, *args)
+                    for size, sq, first in zip(sizes, seeds, starts)]
+            return [fut.result() for fut in futs]
         
                     
     def __set_name_coef(self, dim, i):
@@ -269,6 +935,258 @@ class stkup():
                 ret = str(dim.direction) + '*' 
         return ret 
 
+
+
+@dataclass
+class stkup_result():
+    '''
+    Figures of stkup.compare(): worst case, statistical (tolerance interval
+    and std), Monte Carlo and convolution stackups with their dppm, Monte
+    Carlo draws / seed and wall time of each stage (in seconds)
+    '''
+    name: str = ''
+    nominal: float = None
+    lsl: float = None
+    usl: float = None
+    wc_min: float = None
+    wc_max: float = None
+    ti: float = None
+    std: float = None
+    std_dppm: float = None
+    mc_mu: float = None
+    mc_std: float = None
+    mc_norm_dppm: float = None
+    mc_count_dppm: float = None
+    mc_draws: int = None
+    mc_metric: str = None
+    mc_precision: float = None
+    conv_mu: float = None
+    conv_std: float = None
+    conv_dppm: float = None
+    seed: int = None
+    sampler: str = None
+    workers: int = None
+    timings: dict = field(default_factory=dict)
+
+
+    def to_dict(self):
+        '''
+        Return the result as a dict of python scalars
+        '''
+        ret = asdict(self)
+        for key, val in ret.items():
+            if isinstance(val, np.generic):
+                ret[key] = val.item()
+        ret['timings'] = {k: float(v) for k, v in self.timings.items()}
+        return ret
+
+
+    def to_json(self):
+        '''
+        Return the result as a JSON string
+        '''
+        return json.dumps(self.to_dict())
+
+
+    def to_series(self):
+        '''
+        Return the result as a pandas Series (one DataFrame row), timings
+        being flattened as time_<stage> entries
+        '''
+        ret = self.to_dict()
+        for stage, sec in ret.pop('timings').items():
+            ret['time_' + stage] = sec
+        return pd.Series(ret)
+
+
+    def render(self, timings=False):
+        '''
+        Print the result
+        timings: if True, also print wall time of each stage
+        '''
+        print('Stackup: %s ' % self.name)
+        print('Nominal: %1.3f' % self.nominal)
+        print('Worst case - min: %1.3f, max: %1.3f' % (self.wc_min, self.wc_max))
+        print('Statistical (tolerance interval) - mu %1.3f, s %1.3f' %
+              (self.nominal, self.ti))
+        print('Statistical (std) - mu %1.3f, s %1.3f' %
+              (self.nominal, self.std))
+        if self.std_dppm is not None:
+            print('Statistical (std) - defects: %6.2f' % self.std_dppm)
+        if self.mc_metric is not None:
+            print('Monte Carlo - draws %i, %s precision %1.3g' %
+                  (self.mc_draws, self.mc_metric, self.mc_precision))
+        print('Monte Carlo - mu %1.3f, std %1.3f' % (self.mc_mu, self.mc_std))
+        if self.mc_norm_dppm is not None:
+            print('Statistical (Monte Carlo) - defects: %6.2f' % self.mc_norm_dppm)
+            print('Monte Carlo - observed defects: %6.2f' % self.mc_count_dppm)
+        if self.conv_mu is not None:
+            print('Convolution - mu %1.3f, std %1.3f' % (self.conv_mu, self.conv_std))
+        if self.conv_dppm is not None:
+            print('Convolution - defects: %6.2f' % self.conv_dppm)
+        if timings:
+            for stage, sec in self.timings.items():
+                print('Time - %s: %1.4f s' % (stage, sec))
+
+
+class dppm_eval():
+
+
+    def __init__(self, pop, dist='norm'):
+        '''
+        Defect occurrence evaluator of a population for any number of spec
+        limits: the normal law is fitted, or the population sorted, only once
+        pop: sample
+        dist: either norm (fitted normal law) or empirical (observed defects)
+        '''
+        self.dist = dist
+        if dist == 'norm':
+            self.mu_hat, self.std_hat = stats.norm.fit(pop)
+        elif dist == 'empirical':
+            self.sorted = np.sort(pop)
+        else:
+            raise SyntaxError('dist not supported')
+
+
+    @classmethod
+    def from_norm(cls, mu, std):
+        '''
+        Return a normal law evaluator of known mean and standard deviation
+        mu: mean
+        std: standard deviation
+        '''
+        ret = cls.__new__(cls)
+        ret.dist = 'norm'
+        ret.mu_hat = mu
+        ret.std_hat = std
+        return ret
+
+
+    def __call__(self, lsl=None, usl=None):
+        '''
+        Return total defect occurrence (in dppm) beyond lsl and usl
+        lsl: Lower Specification Limit, scalar or vector (NaN for no limit)
+        usl: Upper Specification Limit, scalar or vector (NaN for no limit)
+        '''
+        lsl_p, usl_p = self.tails(lsl=lsl, usl=usl)
+        return (lsl_p + usl_p) * 10**6
+
+
+    def tails(self, lsl=None, usl=None):
+        '''
+        Return (probability below lsl, probability above usl), broadcast on
+        lsl and usl
+        lsl: Lower Specification Limit, scalar or vector (NaN for no limit)
+        usl: Upper Specification Limit, scalar or vector (NaN for no limit)
+        '''
+        _chk_limits(lsl, usl)
+        lsl = np.asarray(np.nan if lsl is None else lsl, dtype=float)
+        usl = np.asarray(np.nan if usl is None else usl, dtype=float)
+        if self.dist == 'norm':
+            lsl_p = stats.norm.cdf(lsl, loc=self.mu_hat, scale=self.std_hat)
+            usl_p = stats.norm.sf(usl, loc=self.mu_hat, scale=self.std_hat)
+        else:
+            n = len(self.sorted)
+            lsl_p = np.searchsorted(self.sorted, lsl, side='left') / n
+            usl_p = (n - np.searchsorted(self.sorted, usl, side='right')) / n
+        lsl_p = np.where(np.isnan(lsl), 0.0, lsl_p)
+        usl_p = np.where(np.isnan(usl), 0.0, usl_p)
+        if not lsl_p.ndim and not usl_p.ndim:
+            return (float(lsl_p), float(usl_p))
+        return np.broadcast_arrays(lsl_p, usl_p)
+
+
+def _chk_limits(lsl, usl):
+    if lsl is None or usl is None:
+        return
+    if np.any(np.asarray(lsl) >= np.asarray(usl)):
+        raise SyntaxError('mini must be strictly inferior to maxi')
+
+
+def batch_stkup(variants, lsl=None, usl=None):
+    '''
+    Evaluate many stackup variants at once.
+    Return a dataframe (one row per variant) with nominal, worst case
+    (wc_min, wc_max), statistical tolerance interval (ti), standard deviation
+    (std) and normal defect occurrence (dppm) of the stackups
+    variants: dataframe with one row per variant and (dimension, field) columns,
+              fields being direction, lsl, usl and Ppk_min (equiprobable
+              dimension if Ppk_min is NaN), see stkup.to_variant()
+    lsl: Lower Specification Limit of the stackup
+    usl: Upper Specification Limit of the stackup
+    '''
+    if lsl is not None and usl is not None and lsl >= usl:
+        raise SyntaxError('lsl must be strictly inferior to usl')
+    fields = {}
+    for field in ('direction', 'lsl', 'usl', 'Ppk_min'):
+        if field not in variants.columns.get_level_values(1):
+            raise SyntaxError('%s missing from variants' % field)
+        fields[field] = variants.xs(field, axis=1, level=1).to_numpy(dtype=float)
+    coef = fields['direction']
+    dim_lsl = fields['lsl']
+    dim_usl = fields['usl']
+    ppk = fields['Ppk_min']
+    width = dim_usl - dim_lsl
+    dim_std = np.where(np.isnan(ppk), width / np.sqrt(12), width / (6 * ppk))
+    ret = pd.DataFrame(index=variants.index)
+    ret['nominal'] = np.sum(coef * (dim_lsl + dim_usl) / 2, axis=1)
+    ret['wc_min'] = np.sum(np.where(coef > 0, coef * dim_lsl, coef * dim_usl), axis=1)
+    ret['wc_max'] = np.sum(np.where(coef > 0, coef * dim_usl, coef * dim_lsl), axis=1)
+    ret['ti'] = np.sqrt(np.sum((coef * width / 2) ** 2, axis=1))
+    ret['std'] = np.sqrt(np.sum((coef * dim_std) ** 2, axis=1))
+    dppm = np.zeros(len(ret))
+    if lsl is not None:
+        dppm += stats.norm.cdf(lsl, loc=ret['nominal'], scale=ret['std'])
+    if usl is not None:
+        dppm += stats.norm.sf(usl, loc=ret['nominal'], scale=ret['std'])
+    ret['dppm'] = dppm * 10**6
+    return ret
+
+
+def _sobol_draws(size, room, workers):
+    # draws as workers times a power of 2, rounded up from size while within
+    # room (0 if room is below workers)
+    per = 2 ** int(np.ceil(np.log2(max(size / workers, 1))))
+    while per > 1 and workers * per > room:
+        per //= 2
+    return workers * per if workers * per <= room else 0
+
+
+def _mc_pop(stk, draws, seed, first, chunk, sampler, path):
+    # fill [first, first + draws[ of the .npy file at path if given
+    rng = np.random.default_rng(seed)
+    engine = stk.sampler_engine(sampler, rng)
+    coefs = stk.directions()
+    if path is None:
+        ret = np.empty(draws)
+    else:
+        ret = np.load(path, mmap_mode='r+')[first:first + draws]
+    for start in range(0, draws, chunk):
+        stop = min(start + chunk, draws)
+        ret[start:stop] = stk.draw_matrix(stop - start, rng, engine) @ coefs
+    if path is not None:
+        ret.flush()
+        return None
+    return ret
+
+
+def _mc_stats(stk, draws, seed, first, chunk, sampler, lsl, usl, contrib):
+    rng = np.random.default_rng(seed)
+    engine = stk.sampler_engine(sampler, rng)
+    coefs = stk.directions()
+    ret = accum.moments(lsl=lsl, usl=usl)
+    co = None
+    if contrib:
+        co = accum.comoments(lsl=lsl, usl=usl)
+    for start in range(0, draws, chunk):
+        stop = min(start + chunk, draws)
+        mat = stk.draw_matrix(stop - start, rng, engine)
+        pop = mat @ coefs
+        ret.update(pop)
+        if contrib:
+            co.update(mat, pop)
+    return (ret, co)
+
     
 if __name__ == '__main__':
     import matplotlib.pyplot as plt
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+
+class segments():
+
+
+    def __init__(self, values, offsets, cats=None):
+        '''
+        Values of several categories grouped once in a single contiguous
+        vector (CSR layout): category i is values[offsets[i]:offsets[i + 1]].
+        Categories are served as views of values, never copied.
+        values: 1D vector of values grouped by category
+        offsets: start of each category in values, followed by len(values)
+        cats: category labels (0 to len(offsets) - 2 if None)
+        '''
+        self.values = np.ascontiguousarray(values, dtype=float)
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        if self.offsets.ndim != 1 or not len(self.offsets) or self.offsets[0] != 0 \
+           or self.offsets[-1] != len(self.values) or np.any(np.diff(self.offsets) < 0):
+            raise SyntaxError('offsets must rise from 0 to len(values)')
+        if cats is None:
+            cats = np.arange(len(self.offsets) - 1)
+        if len(cats) != len(self.offsets) - 1:
+            raise SyntaxError('One category needed per segment')
+        self.cats = cats
+        self.n = np.diff(self.offsets)
+
+
+    @classmethod
+    def from_arrays(cls, values, cats=None):
+        '''
+        Return segments of values grouped by cats. values are not copied when
+        they are a contiguous float vector already grouped by category.
+        values: 1D vector of values
+        cats: category of each value (single category if None)
+        '''
+        values = np.ascontiguousarray(values, dtype=float)
+        if cats is None:
+            return cls(values, [0, len(values)], [None])
+        codes, uniques = pd.factorize(np.asarray(cats), use_na_sentinel=False)
+        if len(codes) != len(values):
+            raise SyntaxError('One category needed per value')
+        if np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind='stable')
+            codes, values = codes[order], values[order]
+        offsets = np.searchsorted(codes, np.arange(len(uniques) + 1))
+        return cls(values, offsets, uniques)
+
+
+    @classmethod
+    def from_frame(cls, dat, cat, val):
+        '''
+        Return segments of a long format dataframe
+        dat: long format dataframe
+        cat: category column
+        val: value column
+        '''
+        return cls.from_arrays(dat[val].to_numpy(dtype=float), dat[cat].to_numpy())
+
+
+    @classmethod
+    def from_arrow(cls, data, cat=None, val=None):
+        '''
+        Return segments of pyarrow data, either a list array (one list of
+        values per category, offsets and values buffers are reused) or a
+        table / record batch with cat and val columns
+        data: pyarrow ListArray, ChunkedArray of lists, Table or RecordBatch
+        cat: category column (tables only)
+        val: value column (tables only)
+        '''
+        import pyarrow as pa
+        if isinstance(data, pa.ChunkedArray):
+            data = data.combine_chunks()
+        if isinstance(data, (pa.ListArray, pa.LargeListArray)):
+            return cls(data.values.to_numpy(zero_copy_only=False),
+                       data.offsets.to_numpy() - data.offsets[0].as_py(), None) \
+                if data.offset == 0 else cls.from_arrow(pa.concat_arrays([data]), cat, val)
+        if cat is None or val is None:
+            raise SyntaxError('cat and val columns needed for tables')
+        col = lambda name: data.column(name)
+        values = col(val)
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        return cls.from_arrays(values.to_numpy(zero_copy_only=False),
+                               col(cat).to_numpy(zero_copy_only=False))
+
+
+    def __len__(self):
+        return len(self.n)
+
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def codes(self):
+        '''
+        Return category index of each value
+        '''
+        return np.repeat(np.arange(len(self)), self.n)
+
+
+    def sums(self, x=None):
+        '''
+        Return sum per category of values (or of x, a vector aligned with
+        values) with one reduceat pass, 0 for empty categories
+        x: 1D vector aligned with values (values if None)
+        '''
+        x = self.values if x is None else x
+        ret = np.zeros(len(self), dtype=np.result_type(x, float))
+        full = self.n > 0
+        if np.any(full):
+            ret[full] = np.add.reduceat(x, self.offsets[:-1][full])
+        return ret
+
+
+    def stats(self, ddof=0):
+        '''
+        Return count, mean and standard deviation of each category
+        (NaN for empty categories)
+        ddof: delta degrees of freedom
+        '''
+        return group_stats(self.codes(), self.values, len(self), ddof)
+
+
+def group_stats(codes, x, ncat, ddof=0):
+    '''
+    Return count, mean and standard deviation of x per category (NaN for
+    empty categories), with one bincount pass per moment. Values need not
+    be grouped by category.
+    codes: category index (0 to ncat - 1) of each value
+    x: 1D vector of values
+    ncat: number of categories
+    ddof: delta degrees of freedom
+    '''
+    n = np.bincount(codes, minlength=ncat)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu = np.bincount(codes, weights=x, minlength=ncat) / n
+        # centered second pass, numerically stable
+        m2 = np.bincount(codes, weights=(x - mu[codes]) ** 2, minlength=ncat)
+        std = np.sqrt(m2 / (n - ddof))
+    return (n, mu, std)
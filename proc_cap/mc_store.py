@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+import numpy as np
+
+class mc_store():
+
+
+    def __init__(self, path, max_bytes=10 * 2**30):
+        '''
+        On disk store of simulated populations, saved as .npy files and
+        memory-mapped when reused. Least recently used files are evicted when
+        the store exceeds max_bytes.
+        path: store directory (created if needed)
+        max_bytes: size cap of the store
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+
+    def key(self, *parts):
+        '''
+        Return the store key of a population from what defines it
+        (inputs fingerprint, draws, seed...)
+        '''
+        ret = hashlib.sha1()
+        for part in parts:
+            ret.update(repr(part).encode())
+            ret.update(b'\0')
+        return ret.hexdigest()
+
+
+    def load(self, key):
+        '''
+        Return the stored population as a read-only memory map, None if missing
+        key: store key
+        '''
+        path = self.__file(key)
+        if not os.path.exists(path):
+            return None
+        # mark as recently used for eviction
+        os.utime(path)
+        return np.load(path, mmap_mode='r')
+
+
+    def create(self, key, size):
+        '''
+        Create an empty population of size float values to be filled in place,
+        return the path of the temporary file to be opened with
+        np.load(path, mmap_mode='r+'), then published with commit()
+        key: store key
+        size: number of values
+        '''
+        path = self.__file(key) + '.tmp.npy'
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(size,))
+        del out
+        return path
+
+
+    def commit(self, key):
+        '''
+        Publish a population filled after create(), evict least recently used
+        populations beyond max_bytes and return the population (see load())
+        key: store key
+        '''
+        path = self.__file(key)
+        os.replace(path + '.tmp.npy', path)
+        self.evict(keep=key)
+        return self.load(key)
+
+
+    def evict(self, keep=None):
+        '''
+        Remove least recently used populations until the store fits max_bytes
+        keep: key never evicted
+        '''
+        files = []
+        for name in os.listdir(self.path):
+            if name.endswith('.npy') and not name.endswith('.tmp.npy'):
+                path = os.path.join(self.path, name)
+                files.append((os.path.getmtime(path), os.path.getsize(path), path))
+        files.sort()
+        total = sum(size for mtime, size, path in files)
+        for mtime, size, path in files:
+            if total <= self.max_bytes:
+                break
+            if keep is not None and path == self.__file(keep):
+                continue
+            os.remove(path)
+            total -= size
+
+
+    def __file(self, key):
+        return os.path.join(self.path, key + '.npy')
@@ -74,7 +74,7 @@ def calc_ppk(smpl, lsl, usl, sd = None):
     else:
         mu = np.mean(smpl)
         sd_pop = sd
-    ret = Ppk.Ppk(mu, sd_pop, lsl, usl)
+    ret = Ppk.Ppk(mu, sd_pop, usl, lsl)
     return ret
 
     
@@ -6,6 +6,7 @@ import numpy as np
 from scipy.stats import shapiro, anderson, kstest, normaltest
 import random
 import string
+import columnar
 
 set_dbg_lvl(False)
 
@@ -63,10 +64,15 @@ def kolgomorov(x, dist='norm', stat=False):
 def batch(x, dist='norm', ad=True, kolg=True, shap=True, stat=False):
     ''' 
     Return p-values and test stats (if stat set to True) for x 
-    x can be a 1D vector or array of 1D vectors
+    x can be a 1D vector or array of 1D vectors, or columnar.segments
+    (dataframe of results per category, tests run on views of each category)
     '''
     if not ad and not kolg and not shap:
         raise SyntaxError('At least one normality test needed')
+    if isinstance(x, columnar.segments):
+        ret = pd.DataFrame([batch(seg, dist, ad, kolg, shap, stat) for seg in x])
+        ret.insert(0, 'cat', x.cats)
+        return ret
     ret = {}
     if ad:
         anderson_ret = AD(x, dist=dist, stat=True)
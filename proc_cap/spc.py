@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from scipy import signal
+import Ppk
+
+# d3 constant (std of range of n standard normal values), n = 2 to 25
+_D3 = dict(zip(range(2, 26), (0.853, 0.888, 0.880, 0.864, 0.848, 0.833, 0.820, 0.808,
+                              0.797, 0.787, 0.778, 0.770, 0.763, 0.756, 0.750, 0.744,
+                              0.739, 0.734, 0.729, 0.724, 0.720, 0.716, 0.712, 0.708)))
+# points kept between batches for Western Electric rules
+_WE_TAIL = 7
+
+class chart():
+
+
+    def __init__(self):
+        '''
+        Control chart of one or several categories (machines, cavities...).
+        Limits are computed once per category from a baseline with fit(),
+        then batches of new values are checked with update(). Only a bounded
+        state is kept per category between batches.
+        acc: ppk_acc of baseline values (capability of the baseline)
+        live: ppk_acc of values seen by update() (capability of monitored data)
+        '''
+        self.acc = None
+        self.live = Ppk.ppk_acc()
+        self.lim = {}
+        self.state = {}
+
+
+    def fit(self, values, cats=None):
+        '''
+        Compute control limits of each category from baseline values
+        (at least 2 points with some spread per category). A new fit
+        replaces the limits, state and live statistics of a previous one.
+        values: baseline values in time order
+        cats: category of each value, or a single category
+        '''
+        values = self._check(values)
+        self.live = Ppk.ppk_acc()
+        self.lim = {}
+        self.state = {}
+        self.acc = Ppk.ppk_acc().update(values.ravel(), self.__flat_cats(values, cats))
+        for c, x in self.__groups(values, cats):
+            if len(x) < 2:
+                raise SyntaxError('At least 2 baseline points needed for category %s' % str(c))
+            mu = self.acc.mean[self.acc.index[c]]
+            lim, st = self._limits(x, mu)
+            if not lim['sigma'] > 0:
+                raise SyntaxError('Baseline without spread for category %s' % str(c))
+            self.lim[c], self.state[c] = lim, st
+            self.state[c]['index'] = 0
+        return self
+
+
+    def update(self, values, cats=None):
+        '''
+        Check a batch of new values against the control limits and return a
+        dataframe of alarms (cat, index, chart, rule, value), index being the
+        position of the point after the baseline of its category
+        values: new values in time order
+        cats: category of each value, or a single category
+        '''
+        values = self._check(values)
+        cols = {'cat': [], 'index': [], 'chart': [], 'rule': [], 'value': []}
+        # empty polls of a live stream leave the state unchanged
+        if len(values):
+            self.live.update(values.ravel(), self.__flat_cats(values, cats))
+        for c, x in self.__groups(values, cats):
+            if not len(x):
+                continue
+            if c not in self.lim:
+                raise SyntaxError('No baseline for category %s' % str(c))
+            st = self.state[c]
+            for mask, name, rule, val in self._scan(x, self.lim[c], st):
+                idx = np.flatnonzero(mask)
+                cols['cat'] += [c] * len(idx)
+                cols['index'].append(st['index'] + idx)
+                cols['chart'] += [name] * len(idx)
+                cols['rule'] += [rule] * len(idx)
+                cols['value'].append(val[idx])
+            st['index'] += len(x)
+        for key in ('index', 'value'):
+            cols[key] = np.concatenate(cols[key]) if cols[key] else np.zeros(0)
+        cols['index'] = cols['index'].astype(int)
+        return pd.DataFrame(cols)
+
+
+    def limits(self):
+        '''
+        Return a dataframe of control limits per category
+        '''
+        ret = pd.DataFrame(list(self.lim.values()))
+        ret.insert(0, 'cat', list(self.lim))
+        return ret
+
+
+    def _check(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.ndim != 1:
+            raise SyntaxError('1D vector of values needed')
+        return values
+
+
+    def __flat_cats(self, values, cats):
+        if cats is None or np.ndim(cats) == 0 or values.ndim == 1:
+            return cats
+        return np.repeat(np.asarray(cats), values.shape[1])
+
+
+    def __groups(self, values, cats):
+        if cats is None or np.ndim(cats) == 0:
+            yield cats, values
+            return
+        codes, uniques = pd.factorize(np.asarray(cats), use_na_sentinel=False)
+        if len(codes) != len(values):
+            raise SyntaxError('One category needed per value')
+        # stable sort keeps time order within categories
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for i, c in enumerate(uniques):
+            yield Ppk._na_key(c), values[order[bounds[i]:bounds[i + 1]]]
+
+
+class imr(chart):
+
+
+    def __init__(self, rules=True):
+        '''
+        Individuals (I) and Moving Range (MR) chart, sigma estimated by
+        mean moving range / d2(2)
+        rules: if True, check Western Electric rules 2 to 4 on I chart
+               (rule 1 - point beyond limits - always checked)
+        '''
+        chart.__init__(self)
+        self.rules = rules
+
+
+    def _limits(self, x, mu):
+        mrbar = np.mean(np.abs(np.diff(x)))
+        sigma = mrbar / Ppk.d2(2)
+        lim = {'center': mu, 'sigma': sigma, 'lcl': mu - 3 * sigma, 'ucl': mu + 3 * sigma,
+               'mr_center': mrbar, 'mr_ucl': (1 + 3 * _D3[2] / Ppk.d2(2)) * mrbar}
+        return (lim, {'last': x[-1], 'tail': np.zeros(0)})
+
+
+    def _scan(self, x, lim, st):
+        mr = np.abs(np.diff(x, prepend=st['last']))
+        st['last'] = x[-1]
+        z = (x - lim['center']) / lim['sigma']
+        ret = [(mr > lim['mr_ucl'], 'MR', 'limit', mr)]
+        for rule, mask in western_electric(z, st, self.rules).items():
+            ret.append((mask, 'I', rule, x))
+        return ret
+
+
+class xbar_r(chart):
+
+
+    def __init__(self, rules=True):
+        '''
+        X-bar and R chart of subgroups of fixed size n (2 to 25), values being
+        (subgroups x n) matrices, sigma estimated by mean range / d2(n)
+        rules: if True, check Western Electric rules 2 to 4 on X-bar chart
+               (rule 1 - point beyond limits - always checked)
+        '''
+        chart.__init__(self)
+        self.rules = rules
+        self.n = None
+
+
+    def fit(self, values, cats=None):
+        # a new baseline may change the subgroup size
+        self.n = None
+        return chart.fit(self, values, cats)
+
+
+    def _check(self, values):
+        values = np.asarray(values, dtype=float)
+        if not values.size and self.n is not None:
+            values = values.reshape(0, self.n)
+        if values.ndim != 2 or values.shape[1] not in _D3:
+            raise SyntaxError('(subgroups x n) matrix needed, n from 2 to 25')
+        if self.n is not None and values.shape[1] != self.n:
+            raise SyntaxError('Subgroups of %i values needed' % self.n)
+        self.n = values.shape[1]
+        return values
+
+
+    def _limits(self, x, mu):
+        n = x.shape[1]
+        rbar = np.mean(np.ptp(x, axis=1))
+        d2 = Ppk.d2(n)
+        sigma = rbar / d2 / np.sqrt(n)
+        lim = {'center': mu, 'sigma': sigma, 'lcl': mu - 3 * sigma, 'ucl': mu + 3 * sigma,
+               'r_center': rbar, 'r_lcl': max(0, 1 - 3 * _D3[n] / d2) * rbar,
+               'r_ucl': (1 + 3 * _D3[n] / d2) * rbar}
+        return (lim, {'tail': np.zeros(0)})
+
+
+    def _scan(self, x, lim, st):
+        xbar = np.mean(x, axis=1)
+        r = np.ptp(x, axis=1)
+        z = (xbar - lim['center']) / lim['sigma']
+        ret = [((r > lim['r_ucl']) | (r < lim['r_lcl']), 'R', 'limit', r)]
+        for rule, mask in western_electric(z, st, self.rules).items():
+            ret.append((mask, 'Xbar', rule, xbar))
+        return ret
+
+
+class ewma(chart):
+
+
+    def __init__(self, lam=0.2, L=3):
+        '''
+        Exponentially Weighted Moving Average chart of individual values,
+        z_t = lam * x_t + (1 - lam) * z_t-1 starting from baseline mean, with
+        exact (time-varying) limits, sigma estimated by mean moving range / d2(2)
+        lam: smoothing constant (0 to 1)
+        L: limits width (in EWMA sigma)
+        '''
+        if not 0 < lam <= 1:
+            raise SyntaxError('lam must be in ]0, 1]')
+        chart.__init__(self)
+        self.lam = lam
+        self.L = L
+
+
+    def _limits(self, x, mu):
+        sigma = np.mean(np.abs(np.diff(x))) / Ppk.d2(2)
+        width = self.L * sigma * np.sqrt(self.lam / (2 - self.lam))
+        lim = {'center': mu, 'sigma': sigma, 'lcl': mu - width, 'ucl': mu + width}
+        return (lim, {'z': mu})
+
+
+    def _scan(self, x, lim, st):
+        lam = self.lam
+        # recursion as a first order filter, initial state from previous batch
+        z = signal.lfilter([lam], [1, lam - 1], x, zi=[(1 - lam) * st['z']])[0]
+        st['z'] = z[-1]
+        t = st['index'] + 1 + np.arange(len(x))
+        width = self.L * lim['sigma'] * np.sqrt(lam / (2 - lam) * (1 - (1 - lam) ** (2 * t)))
+        return [(np.abs(z - lim['center']) > width, 'EWMA', 'limit', z)]
+
+
+class cusum(chart):
+
+
+    def __init__(self, k=0.5, h=5):
+        '''
+        Tabular CUSUM chart of individual values standardized by baseline mean
+        and sigma (mean moving range / d2(2)). C+ and C- are not reset after
+        an alarm.
+        k: reference value (in sigma)
+        h: decision interval (in sigma)
+        '''
+        chart.__init__(self)
+        self.k = k
+        self.h = h
+
+
+    def _limits(self, x, mu):
+        sigma = np.mean(np.abs(np.diff(x))) / Ppk.d2(2)
+        lim = {'center': mu, 'sigma': sigma, 'k': self.k, 'h': self.h}
+        return (lim, {'hi': 0.0, 'lo': 0.0})
+
+
+    def _scan(self, x, lim, st):
+        d = (x - lim['center']) / lim['sigma']
+        ret = []
+        for key, dev in (('hi', d), ('lo', -d)):
+            # C_t = max(0, C_t-1 + dev_t - k) = S_t - min(0, min S_s<=t)
+            s = st[key] + np.cumsum(dev - self.k)
+            c = s - np.minimum(0, np.minimum.accumulate(s))
+            st[key] = c[-1]
+            ret.append((c > self.h, 'CUSUM', 'C+' if key == 'hi' else 'C-', c))
+        return ret
+
+
+def western_electric(z, state=None, rules=True):
+    '''
+    Return a dict of Western Electric rule name (WE1 to WE4) and mask of the
+    points of z completing the rule pattern:
+        - WE1 - point beyond 3 sigma,
+        - WE2 - 2 of 3 consecutive points beyond 2 sigma, same side,
+        - WE3 - 4 of 5 consecutive points beyond 1 sigma, same side,
+        - WE4 - 8 consecutive points on same side of center
+    z: standardized points ((x - center) / sigma) in time order
+    state: dict holding tail, last points of previous batch (updated in place)
+    rules: if False, only check WE1
+    '''
+    z = np.asarray(z, dtype=float)
+    ret = {'WE1': np.abs(z) > 3}
+    if not rules:
+        return ret
+    tail = np.zeros(0) if state is None else state['tail']
+    zz = np.concatenate((tail, z))
+    m = len(tail)
+    for rule, lim, k, w in (('WE2', 2, 2, 3), ('WE3', 1, 4, 5), ('WE4', 0, 8, 8)):
+        mask = np.zeros(len(z), dtype=bool)
+        for side in (zz, -zz):
+            out = side > lim
+            mask |= out[m:] & (_window_count(out, w)[m:] >= k)
+        ret[rule] = mask
+    if state is not None:
+        state['tail'] = zz[-_WE_TAIL:]
+    return ret
+
+
+def _window_count(b, w):
+    c = np.concatenate(([0], np.cumsum(b)))
+    i = np.arange(1, len(b) + 1)
+    return c[i] - c[np.maximum(i - w, 0)]
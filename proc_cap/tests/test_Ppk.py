@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import unittest
+from scipy import stats
+from proc_cap import Ppk
+# same module object as the one imported by Ppk (script-style imports)
+columnar = Ppk.columnar
+
+class test_Ppk(unittest.TestCase):
+
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        d = {}
+        for i in range(20):
+            d['c%i' % i] = rng.normal(20 + rng.uniform(-0.5, 0.5), 1 + rng.uniform(-0.2, 0.2), 200)
+        self.dat = pd.DataFrame(d).melt(var_name='lot', value_name='meas')
+        self.lsl = 16
+        self.usl = 25
+
+
+    def test_Ppk(self):
+        self.assertTrue(np.isclose(Ppk.Ppk(20, 1, 25, 16), 4 / 3))
+        self.assertTrue(np.isclose(Ppk.Ppk(20, 1, 25, 16, mul=4), 1))
+        r = Ppk.Ppk(np.array([20, 24]), np.array([1, 1]), 25, 16)
+        self.assertTrue(np.allclose(r, [4 / 3, 1 / 3]))
+        # signed, one-sided when a limit is None
+        self.assertTrue(np.isclose(Ppk.Ppk(30, 1, 25, 16), -5 / 3))
+        self.assertTrue(np.isclose(Ppk.Ppk(10, 1, 25, 16), -2))
+        self.assertTrue(np.isclose(Ppk.Ppk(30, 1, 25, None), -5 / 3))
+        self.assertTrue(np.isclose(Ppk.PpX(10, 1, 16), -2))
+
+
+    def test_batch_ppk(self):
+        r = Ppk.batch_ppk(self.dat, 'lot', 'meas', self.lsl, self.usl)
+        self.assertTrue(list(r['cat']) == list(self.dat['lot'].unique()))
+        for i, c in enumerate(r['cat']):
+            x = self.dat[self.dat['lot'] == c]['meas']
+            self.assertTrue(r['n'][i] == len(x))
+            self.assertTrue(np.isclose(r['Ppk'][i], Ppk.norm(x, lsl=self.lsl, usl=self.usl)))
+        # same signed definition as norm() with mean outside the spec
+        for shift in (10, -10):
+            dat = self.dat.assign(meas=self.dat['meas'] + shift)
+            r = Ppk.batch_ppk(dat, 'lot', 'meas', self.lsl, self.usl)
+            self.assertTrue(np.all(r['Ppk'] < 0))
+            for i, c in enumerate(r['cat'][:3]):
+                x = dat[dat['lot'] == c]['meas']
+                self.assertTrue(np.isclose(r['Ppk'][i], Ppk.norm(x, lsl=self.lsl, usl=self.usl)))
+                self.assertTrue(np.isclose(r['PpU'][i], Ppk.norm(x, usl=self.usl)))
+        self.assertTrue(Ppk.norm(self.dat['meas'], lsl=0, usl=self.usl) > 0)
+        r = Ppk.batch_ppk(self.dat, 'lot', 'meas', None, self.usl, mul=4)
+        self.assertTrue(np.all(np.isnan(r['PpL'])))
+        self.assertTrue(np.allclose(r['Ppk'], (self.usl - r['mu']) / (4 * r['std'])))
+        # mean beyond a limit gives a negative capability
+        r = Ppk.ppk_table(pd.DataFrame({'mu': [30, 20, 10], 'std': [1, 1, 1]}), self.lsl, self.usl)
+        self.assertTrue(np.allclose(r['PpU'], [-5 / 3, 5 / 3, 5]))
+        self.assertTrue(np.allclose(r['PpL'], [14 / 3, 4 / 3, -2]))
+        self.assertTrue(np.allclose(r['Ppk'], [-5 / 3, 4 / 3, -2]))
+        self.assertRaises(NotImplementedError, Ppk.batch_ppk, self.dat, 'lot', 'meas',
+                          self.lsl, self.usl, dist='weibull')
+
+
+    def test_missing_cat(self):
+        # values without category are kept as one NaN category
+        dat = self.dat.copy()
+        dat['sub'] = np.arange(len(dat)) // 5
+        dat.loc[dat.index[::7], 'lot'] = None
+        miss = dat['lot'].isna()
+        ref = Ppk.norm(dat[miss]['meas'], lsl=self.lsl, usl=self.usl)
+        r = Ppk.batch_ppk(dat, 'lot', 'meas', self.lsl, self.usl)
+        self.assertTrue(len(r) == 21 and r['cat'].isna().sum() == 1)
+        self.assertTrue(np.isclose(r[r['cat'].isna()]['Ppk'].iloc[0], ref))
+        r = Ppk.batch_ppk(dat, 'lot', 'meas', self.lsl, self.usl, dist='percentile')
+        self.assertTrue(r['n'][r['cat'].isna()].iloc[0] == miss.sum())
+        acc = Ppk.ppk_acc()
+        for i in range(0, len(dat), 1000):
+            acc.update(dat['meas'][i:i + 1000], dat['lot'][i:i + 1000])
+        r = acc.ppk(lsl=self.lsl, usl=self.usl)
+        self.assertTrue(len(r) == 21 and np.isclose(r[r['cat'].isna()]['Ppk'].iloc[0], ref))
+        r = Ppk.rolling_ppk(dat['meas'], lsl=self.lsl, usl=self.usl, window=20, cats=dat['lot'])
+        self.assertTrue(np.all(np.isfinite(r[miss][19:])))
+        r = Ppk.batch_cpk(dat, 'lot', 'sub', 'meas', self.lsl, self.usl)
+        self.assertTrue(len(r) == 21 and np.isclose(r[r['cat'].isna()]['Ppk'].iloc[0], ref))
+
+
+
+    def test_ppk_acc(self):
+        ref = Ppk.batch_ppk(self.dat, 'lot', 'meas', self.lsl, self.usl)
+        shuffled = self.dat.sample(frac=1, random_state=1)
+        parts = [shuffled.iloc[i:i + 600] for i in range(0, len(shuffled), 600)]
+        acc = Ppk.ppk_acc()
+        for part in parts[:4]:
+            acc.update(part['meas'], part['lot'])
+        other = Ppk.ppk_acc()
+        for part in parts[4:]:
+            other.update(part['meas'], part['lot'])
+        r = acc.merge(other).ppk(lsl=self.lsl, usl=self.usl).set_index('cat').loc[ref['cat']]
+        self.assertTrue(np.array_equal(r['n'], ref['n']))
+        self.assertTrue(np.allclose(r['mu'], ref['mu']))
+        self.assertTrue(np.allclose(r['Ppk'], ref['Ppk']))
+        single = Ppk.ppk_acc().update(self.dat['meas'][:200], 'c0')
+        self.assertTrue(np.isclose(single.ppk(self.lsl, self.usl)['Ppk'][0], ref['Ppk'][0]))
+
+
+
+    def test_rolling_ppk(self):
+        x = pd.Series(np.random.default_rng(2).normal(20, 1, 500) + 1e6)
+        r = Ppk.rolling_ppk(x, lsl=1e6 + 16, usl=1e6 + 25, window=50)
+        roll = x.rolling(50)
+        ref = np.fmin(np.abs(roll.mean() - 1e6 - 16), np.abs(1e6 + 25 - roll.mean())) \
+            / (3 * roll.std(ddof=0))
+        self.assertTrue(np.all(np.isnan(r[:49])))
+        self.assertTrue(np.allclose(r[49:], ref[49:]))
+        # per category, on timestamps
+        dat = self.dat.copy()
+        dat['time'] = pd.Timestamp('2026-01-01') + pd.to_timedelta(np.arange(len(dat)) % 200, unit='s')
+        r = Ppk.rolling_ppk(dat['meas'], lsl=self.lsl, usl=self.usl, window='30s',
+                            time=dat['time'], cats=dat['lot'])
+        self.assertTrue(r.index.equals(dat.index))
+        for c in ('c0', 'c7'):
+            sub = dat[dat['lot'] == c].set_index('time')['meas']
+            roll = sub.rolling('30s')
+            ref = np.fmin(np.abs(roll.mean() - self.lsl), np.abs(self.usl - roll.mean())) \
+                / (3 * roll.std(ddof=0))
+            self.assertTrue(np.allclose(r[dat['lot'] == c][1:], ref[1:]))
+        # numeric window on numeric time, in time unit
+        secs = (dat['time'] - dat['time'].min()).dt.total_seconds()
+        r2 = Ppk.rolling_ppk(dat['meas'], lsl=self.lsl, usl=self.usl, window=30,
+                             time=secs, cats=dat['lot'])
+        self.assertTrue(np.allclose(r2, r, equal_nan=True))
+        # window unit must match time
+        self.assertRaises(SyntaxError, Ppk.rolling_ppk, dat['meas'], self.lsl, self.usl,
+                          30, dat['time'])
+        self.assertRaises(SyntaxError, Ppk.rolling_ppk, dat['meas'], self.lsl, self.usl, '30s')
+        self.assertRaises(SyntaxError, Ppk.rolling_ppk, dat['meas'], self.usl, self.lsl)
+        self.assertRaises(SyntaxError, Ppk.norm_ppm, 20, 1, self.usl, self.lsl)
+
+
+
+    def test_boot_ppk(self):
+        dat = self.dat[self.dat['lot'].isin(['c0', 'c1', 'c2'])]
+        ref = Ppk.batch_ppk(dat, 'lot', 'meas', self.lsl, self.usl)
+        for method in ('percentile', 'bca'):
+            r = Ppk.boot_ppk(dat, 'lot', 'meas', self.lsl, self.usl, B=1000, method=method,
+                             chunk=10**4, seed=1)
+            self.assertTrue(list(r['cat']) == list(ref['cat']))
+            self.assertTrue(np.allclose(r['Ppk'], ref['Ppk']))
+            self.assertTrue(np.all(r['lo'] < r['Ppk']) and np.all(r['Ppk'] < r['hi']))
+            # normal theory half width of Ppk: z * sqrt(1 / (9n) + Ppk**2 / (2n))
+            half = 1.96 * np.sqrt(1 / (9 * r['n']) + r['Ppk'] ** 2 / (2 * r['n']))
+            self.assertTrue(np.allclose(r['hi'] - r['lo'], 2 * half, rtol=0.25))
+        again = Ppk.boot_ppk(dat, 'lot', 'meas', self.lsl, self.usl, B=1000, method='bca',
+                             seed=1, workers=2)
+        self.assertTrue(np.allclose(again['lo'], r['lo']) and np.allclose(again['hi'], r['hi']))
+        self.assertRaises(SyntaxError, Ppk.boot_ppk, dat, 'lot', 'meas', self.lsl, self.usl,
+                          method='student')
+        # degenerate categories (single value, no spread) don't abort other ones
+        odd = pd.concat([dat, pd.DataFrame({'lot': ['one', 'flat', 'flat', 'two', 'two'],
+                                            'meas': [20, 21, 21, 20, 22]})])
+        for method in ('percentile', 'bca'):
+            r = Ppk.boot_ppk(odd, 'lot', 'meas', self.lsl, self.usl, B=200, method=method, seed=1)
+            r = r.set_index('cat')
+            self.assertTrue(np.all(np.isfinite(r.loc[['c0', 'c1', 'c2'], ['lo', 'hi']])))
+            self.assertTrue(np.all(np.isnan(r.loc[['one', 'flat'], ['lo', 'hi']])))
+
+
+
+    def test_Ppk2ppm(self):
+        ppk = np.array([0.5, 1, 1.33, 1.67, 2, 2.5])
+        ref = stats.norm.sf(3 * ppk) * 10**6
+        self.assertTrue(np.allclose(Ppk.Ppk2ppm(ppk), ref, rtol=1e-12))
+        self.assertTrue(np.allclose(Ppk.Ppk2ppm(ppk, two_sided=True), 2 * ref, rtol=1e-12))
+        self.assertTrue(np.isclose(Ppk.Ppk2ppm(1), 1349.898, rtol=1e-6))
+        self.assertTrue(np.allclose(Ppk.ppm2Ppk(Ppk.Ppk2ppm(ppk)), ppk, rtol=1e-12))
+        self.assertTrue(np.allclose(Ppk.ppm2Ppk(Ppk.Ppk2ppm(ppk, True), True), ppk, rtol=1e-12))
+        mu = np.array([20, 21, 19.5])
+        std = np.array([1, 0.5, 2])
+        ref = (stats.norm.cdf(self.lsl, mu, std) + stats.norm.sf(self.usl, mu, std)) * 10**6
+        self.assertTrue(np.allclose(Ppk.norm_ppm(mu, std, self.lsl, self.usl), ref, rtol=1e-12))
+        self.assertTrue(np.allclose(Ppk.norm_ppm(mu, std, None, self.usl),
+                                    stats.norm.sf(self.usl, mu, std) * 10**6, rtol=1e-12))
+        # centred two-sided process
+        std = (self.usl - self.lsl) / 6 / ppk
+        self.assertTrue(np.allclose(Ppk.norm_ppm((self.lsl + self.usl) / 2, std, self.lsl, self.usl),
+                                    Ppk.Ppk2ppm(ppk, two_sided=True), rtol=1e-12))
+        self.assertRaises(SyntaxError, Ppk.norm_ppm, mu, std, None, None)
+
+
+
+    def test_batch_ppk_dists(self):
+        rng = np.random.default_rng(2)
+        dat = pd.DataFrame({'lot': np.repeat(['a', 'b', 'c'], 3000),
+                            'meas': rng.lognormal(0, 0.25, 9000)})
+        lsl, usl = 0.4, 2.5
+        # exact Ppk of the lognormal law, on log scale
+        ref = min(np.log(usl), -np.log(lsl)) / (3 * 0.25)
+        Ppk._fit_cache.clear()
+        for dist in ('percentile', 'boxcox', 'johnson', 'gennorm'):
+            r = Ppk.batch_ppk(dat, 'lot', 'meas', lsl, usl, dist=dist)
+            self.assertTrue(list(r['cat']) == ['a', 'b', 'c'])
+            self.assertTrue(np.all(r['lo'] < r['med']) and np.all(r['med'] < r['hi']))
+            if dist == 'gennorm':
+                # symmetric law, misses skewness like normal law
+                self.assertTrue(np.all(r['Ppk'] < 0.9 * ref))
+            else:
+                self.assertTrue(np.allclose(r['Ppk'], ref, rtol=0.15))
+        self.assertTrue(len(Ppk._fit_cache) == 9)
+        # unchanged categories are not refitted, whatever their order
+        again = Ppk.batch_ppk(dat.iloc[::-1], 'lot', 'meas', lsl, usl, dist='johnson', workers=2)
+        self.assertTrue(len(Ppk._fit_cache) == 9)
+        self.assertTrue(np.allclose(again.set_index('cat').loc[list(r['cat'])]['Ppk'],
+                                    Ppk.batch_ppk(dat, 'lot', 'meas', lsl, usl, dist='johnson')['Ppk']))
+        self.assertRaises(SyntaxError, Ppk.batch_ppk, dat, 'lot', 'meas', -1, usl, dist='boxcox')
+        # too small categories get NaN capability, others are still fitted
+        small = pd.concat([dat, pd.DataFrame({'lot': ['d', 'd'], 'meas': [1.0, 1.1]})])
+        for dist in ('boxcox', 'johnson', 'gennorm'):
+            r = Ppk.batch_ppk(small, 'lot', 'meas', lsl, usl, dist=dist)
+            self.assertTrue(np.isnan(r['Ppk'].iloc[-1]) and np.all(np.isfinite(r['Ppk'].iloc[:-1])))
+        self.assertRaises(SyntaxError, Ppk.batch_ppk, small.assign(meas=small['meas'] - 1),
+                          'lot', 'meas', None, usl, dist='boxcox')
+        self.assertRaises(NotImplementedError, Ppk.batch_ppk, dat, 'lot', 'meas', lsl, usl,
+                          dist='weibull')
+
+
+
+    def test_file_ppk(self):
+        ref = Ppk.batch_ppk(self.dat, 'lot', 'meas', self.lsl, self.usl)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'meas.csv')
+            self.dat.to_csv(path, index=False)
+            r = Ppk.file_ppk(path, 'lot', 'meas', self.lsl, self.usl, chunksize=7)
+            self.assertTrue(list(r['cat']) == list(ref['cat']))
+            self.assertTrue(np.all(r['n'] == ref['n']))
+            self.assertTrue(np.allclose(r[['mu', 'std', 'Ppk']], ref[['mu', 'std', 'Ppk']]))
+            self.assertRaises(SyntaxError, Ppk.file_ppk, path, 'lot', 'meas', self.lsl,
+                              self.usl, fmt='xls')
+            try:
+                import pyarrow
+            except ImportError:
+                return
+            path = os.path.join(tmp, 'meas.parquet')
+            self.dat.to_parquet(path, row_group_size=50)
+            r = Ppk.file_ppk(path, 'lot', 'meas', self.lsl, self.usl, chunksize=7)
+            self.assertTrue(np.allclose(r[['mu', 'std', 'Ppk']], ref[['mu', 'std', 'Ppk']]))
+
+
+
+    def test_segments(self):
+        segs = columnar.segments.from_frame(self.dat, 'lot', 'meas')
+        self.assertTrue(len(segs) == self.dat['lot'].nunique())
+        for c, seg in zip(segs.cats, segs):
+            self.assertTrue(np.shares_memory(seg, segs.values))
+            self.assertTrue(np.allclose(seg, self.dat.loc[self.dat['lot'] == c, 'meas']))
+        for dist in ('norm', 'percentile'):
+            ref = Ppk.batch_ppk(self.dat, 'lot', 'meas', self.lsl, self.usl, dist=dist)
+            r = Ppk.batch_ppk(segs, None, None, self.lsl, self.usl, dist=dist)
+            self.assertTrue(list(r['cat']) == list(ref['cat']))
+            self.assertTrue(np.allclose(r['Ppk'], ref['Ppk']))
+        # grouped contiguous values are used without copy, empty segments allowed
+        x = np.arange(6.)
+        segs = columnar.segments(x, [0, 2, 2, 6], ['a', 'b', 'c'])
+        self.assertTrue(np.shares_memory(segs.values, x))
+        n, mu, std = segs.stats()
+        self.assertTrue(list(n) == [2, 0, 4] and np.isnan(mu[1]) and mu[2] == 3.5)
+        self.assertTrue(np.allclose(segs.sums(), [1, 0, 14]))
+        # same moments from ungrouped category codes
+        order = [4, 0, 2, 5, 1, 3]
+        ret = columnar.group_stats(segs.codes()[order], x[order], 3, ddof=1)
+        self.assertTrue(np.allclose(np.array(ret), np.array(segs.stats(ddof=1)), equal_nan=True))
+        self.assertTrue(list(segs.codes()) == [0, 0, 2, 2, 2, 2])
+        self.assertRaises(SyntaxError, columnar.segments, x, [0, 4, 2, 6])
+        self.assertRaises(SyntaxError, columnar.segments.from_arrays, x, [0, 1])
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return
+        segs = columnar.segments.from_arrow(pa.array([[1., 2.], [3., 4., 5.], []])[1:])
+        self.assertTrue(list(segs.n) == [3, 0] and segs[0].tolist() == [3, 4, 5])
+        ref = Ppk.batch_ppk(self.dat, 'lot', 'meas', self.lsl, self.usl)
+        segs = columnar.segments.from_arrow(pa.Table.from_pandas(self.dat), 'lot', 'meas')
+        r = Ppk.batch_ppk(segs, None, None, self.lsl, self.usl)
+        self.assertTrue(np.allclose(r['Ppk'], ref['Ppk']))
+
+
+
+    def test_batch_cpk(self):
+        self.assertTrue(np.allclose(Ppk.d2([2, 5, 10]), [1.128, 2.326, 3.078], atol=1e-3))
+        self.assertTrue(np.allclose(Ppk.c4([2, 5, 25]), [0.7979, 0.9400, 0.9896], atol=1e-4))
+        # subgroups of 5 values, within std 1, subgroup means drifting with std 1
+        rng = np.random.default_rng(3)
+        sub = np.repeat(np.arange(4000), 5)
+        dat = pd.DataFrame({'lot': np.where(sub % 2, 'a', 'b'), 'sub': sub // 2,
+                            'meas': rng.normal(20, 1, 20000) + np.repeat(rng.normal(0, 1, 4000), 5)})
+        dat = dat.iloc[rng.permutation(len(dat))]
+        ref = Ppk.batch_ppk(dat, 'lot', 'meas', 14, 26)
+        for sigma in ('rbar', 'sbar', 'pooled'):
+            r = Ppk.batch_cpk(dat, 'lot', 'sub', 'meas', 14, 26, sigma=sigma)
+            self.assertTrue(list(r['cat']) == list(ref['cat']))
+            self.assertTrue(list(r['subgroups']) == [2000, 2000])
+            self.assertTrue(np.allclose(r['sigma_w'], 1, rtol=0.03))
+            self.assertTrue(np.allclose(r['Cp'], 2, rtol=0.03))
+            self.assertTrue(np.allclose(r['Ppk'], ref['Ppk']))
+            self.assertTrue(np.allclose(r['Pp'], 2 / np.sqrt(2), rtol=0.05))
+            self.assertTrue(np.all(r['Cpk'] > 1.3 * r['Ppk']))
+        r = Ppk.batch_cpk(dat, 'lot', 'sub', 'meas', None, 26)
+        self.assertTrue(np.all(np.isnan(r['Cp'])) and np.all(r['Cpk'] > 1.3 * r['Ppk']))
+        self.assertRaises(SyntaxError, Ppk.batch_cpk, dat, 'lot', 'sub', 'meas', 14, 26,
+                          sigma='mr')
+
+
+unittest.main()
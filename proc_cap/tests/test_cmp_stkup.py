@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+import unittest
+import warnings
+from proc_cap import cmp_stkup
+from proc_cap import accum
+from proc_cap import mc_store
+import os
+import json
+import tempfile
+# same module object as the one imported by cmp_stkup (script-style imports)
+columnar = cmp_stkup.columnar
+
+class test_cmp_stkup(unittest.TestCase):
+
+
+    def setUp(self):
+        self.dim_a = cmp_stkup.stkup_dim('a', 1, 5, 10, Ppk_min=1.33)
+        self.dim_b = cmp_stkup.stkup_dim('b', 1, 6, 12, Ppk_min=1.0)
+        self.dim_c = cmp_stkup.stkup_dim('c', -1, 9, 11, dist='equiprobable')
+        self.stk = cmp_stkup.stkup(self.dim_a, self.dim_b, self.dim_c)
+
+
+    def test_rndm_vec(self):
+        x = self.dim_a.rndm_vec(10**5, rng=1)
+        self.assertTrue(isinstance(x, np.ndarray))
+        self.assertTrue(len(x) == 10**5)
+        self.assertTrue(abs(np.mean(x) - self.dim_a.mu_hat) < 0.05)
+        self.assertTrue(abs(np.std(x) - self.dim_a.std_hat) < 0.05)
+        x = self.dim_c.rndm_vec(10**5, rng=1)
+        self.assertTrue(self.dim_c.lsl <= np.min(x) and np.max(x) <= self.dim_c.usl)
+
+
+    def test_monte_carlo(self):
+        pop = self.stk.monte_carlo(draws=10**5, seed=1, chunk=3 * 10**4)
+        self.assertTrue(isinstance(pop, np.ndarray))
+        self.assertTrue(len(pop) == 10**5)
+        self.assertTrue(abs(np.mean(pop) - self.stk.nominal) < 0.05)
+        self.assertTrue(abs(np.std(pop) - self.stk.stats('std')) < 0.05)
+        self.assertTrue(np.array_equal(pop, self.stk.monte_carlo(draws=10**5, seed=1,
+                                                                 chunk=3 * 10**4)))
+
+
+
+    def test_moments(self):
+        x = np.random.normal(3, 2, 10**4)
+        acc = accum.moments(lsl=0, usl=6)
+        for part in np.array_split(x, 7):
+            acc.update(part)
+        self.assertTrue(acc.n == len(x))
+        self.assertTrue(np.isclose(acc.mean, np.mean(x)))
+        self.assertTrue(np.isclose(acc.std(), np.std(x)))
+        self.assertTrue(acc.min == np.min(x) and acc.max == np.max(x))
+        self.assertTrue(acc.below == np.sum(x < 0) and acc.above == np.sum(x > 6))
+        left = accum.moments(lsl=0, usl=6).update(x[:1234])
+        right = accum.moments(lsl=0, usl=6).update(x[1234:])
+        left.merge(right)
+        self.assertTrue(np.isclose(left.var(), acc.var()))
+        self.assertTrue(left.below + left.above == acc.below + acc.above)
+        self.assertRaises(SyntaxError, left.merge, accum.moments(lsl=1))
+
+
+    def test_mc_stream(self):
+        acc = self.stk.mc_stream(draws=10**5, lsl=-1, usl=8, seed=1, chunk=3 * 10**4)
+        pop = self.stk.monte_carlo(draws=10**5, seed=1, chunk=3 * 10**4)
+        self.assertTrue(acc.n == 10**5)
+        self.assertTrue(np.isclose(acc.mean, np.mean(pop)))
+        self.assertTrue(np.isclose(acc.std(), np.std(pop)))
+        self.assertTrue(acc.below == np.sum(pop < -1) and acc.above == np.sum(pop > 8))
+
+
+
+    def test_workers(self):
+        acc = self.stk.mc_stream(draws=10**5, lsl=-1, usl=8, seed=3, workers=2)
+        pop = self.stk.monte_carlo(draws=10**5, seed=3, workers=2)
+        self.assertTrue(acc.n == len(pop) == 10**5)
+        self.assertTrue(np.isclose(acc.mean, np.mean(pop)))
+        self.assertTrue(np.isclose(acc.std(), np.std(pop)))
+        self.assertTrue(np.array_equal(pop, self.stk.monte_carlo(draws=10**5, seed=3, workers=2)))
+        self.assertRaises(SyntaxError, self.stk.monte_carlo, workers=0)
+
+
+
+    def test_dppm_is(self):
+        stk = cmp_stkup.stkup(self.dim_a, self.dim_b)
+        mu, s = stk.nominal, stk.stats('std')
+        lsl, usl = mu - 5.5 * s, mu + 6 * s
+        r = stk.dppm_is(lsl=lsl, usl=usl, draws=10**5, seed=1)
+        for key, th in (('lsl', stats.norm.cdf(-5.5)), ('usl', stats.norm.sf(6))):
+            dppm, se = r[key]
+            self.assertTrue(abs(dppm - th * 10**6) < 5 * se)
+            self.assertTrue(se < 0.05 * dppm)
+        self.assertTrue(np.isclose(r['total'][0], r['lsl'][0] + r['usl'][0]))
+        # tail driven by a bounded dimension, saturating along linearized direction
+        stk = cmp_stkup.stkup(cmp_stkup.stkup_dim('a', 2, 5, 10, Ppk_min=1.33),
+                              cmp_stkup.stkup_dim('b', -3, 6, 12, dist='equiprobable'),
+                              cmp_stkup.stkup_dim('c', 1, 1, 2, Ppk_min=1))
+        mu, s = stk.nominal, stk.stats('std')
+        for k in (2.2, 3):
+            th = stk.conv_dppm(mu - k * s, mu + k * s)
+            for seed in (1, 2, 3):
+                dppm, se = stk.dppm_is(mu - k * s, mu + k * s, draws=10**5, seed=seed)['total']
+                self.assertTrue(abs(dppm - th) < 5 * se and se < 0.02 * th)
+        r = self.stk.dppm_is(usl=self.stk.worst_case()[1] + 100, draws=10**3)
+        self.assertTrue(r['total'] == (0.0, 0.0))
+        self.assertRaises(SyntaxError, self.stk.dppm_is)
+
+
+
+    def test_samplers(self):
+        for sampler in ('sobol', 'lhs'):
+            pop = self.stk.monte_carlo(draws=2**14, seed=1, chunk=2**12, sampler=sampler)
+            self.assertTrue(len(pop) == 2**14)
+            self.assertTrue(abs(np.mean(pop) - self.stk.nominal) < 0.01)
+            self.assertTrue(abs(np.std(pop) - self.stk.stats('std')) < 0.01)
+            self.assertTrue(np.array_equal(pop, self.stk.monte_carlo(draws=2**14, seed=1,
+                                                                     chunk=2**12,
+                                                                     sampler=sampler)))
+        self.assertRaises(SyntaxError, self.stk.monte_carlo, sampler='halton')
+
+
+
+    def test_convolve(self):
+        stk = cmp_stkup.stkup(self.dim_a, self.dim_b)
+        conv = stk.convolve()
+        mu = np.sum(conv['x'] * conv['pmf'])
+        self.assertTrue(abs(np.sum(conv['pmf']) - 1) < 1e-9)
+        self.assertTrue(abs(mu - stk.nominal) < 1e-6)
+        s = stk.stats('std')
+        self.assertTrue(abs(np.sqrt(np.sum((conv['x'] - mu) ** 2 * conv['pmf'])) - s) < 1e-4)
+        dppm = stk.conv_dppm(lsl=mu - 5 * s, usl=mu + 6 * s, conv=conv)
+        th = (stats.norm.cdf(-5) + stats.norm.sf(6)) * 10**6
+        self.assertTrue(abs(dppm - th) < 0.01 * th)
+        # uniform and normal mix, against Monte Carlo
+        dppm = self.stk.conv_dppm(lsl=-1, usl=8)
+        acc = self.stk.mc_stream(draws=10**6, lsl=-1, usl=8, seed=1)
+        self.assertTrue(abs(dppm - acc.count_dppm()) < 0.05 * dppm)
+
+
+
+    def test_batch_stkup(self):
+        variants = self.stk.to_variant()
+        variants = pd.concat([variants, variants], ignore_index=True)
+        variants.loc[1, ('b', 'Ppk_min')] = 2.0
+        r = cmp_stkup.batch_stkup(variants, lsl=-1, usl=8)
+        self.assertTrue(len(r) == 2)
+        self.assertTrue(np.isclose(r['nominal'][0], self.stk.nominal))
+        self.assertTrue(np.allclose((r['wc_min'][0], r['wc_max'][0]), self.stk.worst_case()))
+        self.assertTrue(np.isclose(r['ti'][0], self.stk.stats('ti')))
+        self.assertTrue(np.isclose(r['std'][0], self.stk.stats('std')))
+        self.assertTrue(r['std'][1] < r['std'][0] and r['dppm'][1] < r['dppm'][0])
+        self.assertRaises(SyntaxError, cmp_stkup.batch_stkup,
+                          variants.drop(columns='lsl', level=1))
+
+
+
+    def test_allocate(self):
+        lsl, usl = -2, 7
+        for method in ('rss', 'conv'):
+            stk, alloc, check = self.stk.allocate(lsl, usl, 10, weights={'a': 1, 'b': 4, 'c': 1},
+                                                  method=method, seed=1)
+            self.assertTrue(len(alloc) == 3 and np.isclose(stk.nominal, self.stk.nominal))
+            if method == 'rss':
+                dppm = cmp_stkup.batch_stkup(stk.to_variant(), lsl=lsl, usl=usl)['dppm'][0]
+            else:
+                dppm = stk.conv_dppm(lsl=lsl, usl=usl)
+                self.assertTrue(abs(check['total'][0] - 10) < 5 * check['total'][1] + 0.5)
+            self.assertTrue(np.isclose(dppm, 10, rtol=0.01))
+            # costlier dimension gets the wider tolerance
+            self.assertTrue(alloc['tol'][1] > alloc['tol'][0])
+        self.assertRaises(SyntaxError, self.stk.allocate, 10, 20, 10)
+        for dppm in (0, 10**6, 2e6):
+            self.assertRaises(SyntaxError, self.stk.allocate, lsl, usl, dppm)
+
+
+
+    def test_contributions(self):
+        acc, co = self.stk.mc_stream(draws=10**5, lsl=2, usl=11, seed=1, chunk=3 * 10**4,
+                                     workers=2, contrib=True)
+        self.assertTrue(co.n == acc.n)
+        self.assertTrue(np.isclose(co.mean[-1], acc.mean))
+        self.assertTrue(np.isclose(co.cov()[-1, -1], acc.var()))
+        r = self.stk.contributions(co)
+        self.assertTrue(np.isclose(np.sum(r['var_pct']), 100))
+        th = 100 * np.array([dim.std_hat ** 2 for dim in self.stk.dims]) / self.stk.stats('std') ** 2
+        self.assertTrue(np.allclose(r['var_pct'], th, atol=1))
+        self.assertTrue(np.isclose(np.sum(r['lsl_pct']), 100))
+        self.assertTrue(np.isclose(np.sum(r['usl_pct']), 100))
+        self.assertTrue(np.all(np.abs(r['corr']) <= 1))
+
+
+
+    def test_corr(self):
+        corr = np.array([[1, 0.6, 0.3], [0.6, 1, -0.2], [0.3, -0.2, 1]])
+        stk = cmp_stkup.stkup(self.dim_a, self.dim_b, self.dim_c, corr=corr)
+        std = np.array([dim.std_hat for dim in stk.dims]) * stk.directions()
+        self.assertTrue(np.isclose(stk.stats('std'), np.sqrt(std @ corr @ std)))
+        self.assertTrue(stk.stats('std') > self.stk.stats('std'))
+        pop = stk.monte_carlo(draws=10**5, seed=1)
+        self.assertTrue(abs(np.std(pop) - stk.stats('std')) < 0.03)
+        mat = stk.draw_matrix(10**5, rng=1)
+        self.assertTrue(np.allclose(np.corrcoef(mat.T), corr, atol=0.03))
+        mu, s = stk.nominal, stk.stats('std')
+        r = stk.dppm_is(lsl=mu - 4 * s, draws=10**5, seed=1)
+        acc = stk.mc_stream(draws=10**6, lsl=mu - 4 * s, seed=2)
+        count_se = np.sqrt(acc.below) / acc.n * 10**6
+        self.assertTrue(abs(r['lsl'][0] - acc.count_dppm()) < 5 * (r['lsl'][1] + count_se))
+        self.assertRaises(NotImplementedError, stk.convolve)
+        self.assertRaises(SyntaxError, cmp_stkup.stkup, self.dim_a, self.dim_b, corr=[[1, 2], [2, 1]])
+        self.assertRaises(SyntaxError, cmp_stkup.stkup, self.dim_a, self.dim_b, corr=np.eye(3))
+
+
+
+    def test_fitted_dims(self):
+        skew = stats.skewnorm(4, loc=5, scale=1)
+        data = skew.rvs(size=10**5, random_state=1)
+        dims = [cmp_stkup.stkup_dim('s', 1, 4, 9, dist=skew),
+                cmp_stkup.stkup_dim('e', 1, 4, 9, dist=data),
+                cmp_stkup.stkup_dim('g', 1, 4, 9, dist='gennorm', fit=(1.5, 6, 0.5))]
+        self.assertTrue([dim.dist for dim in dims] == ['skewnorm', 'empirical', 'gennorm'])
+        # null mean of a law is kept, not replaced by nominal
+        zero = cmp_stkup.stkup_dim('z', 1, -1, 2, dist=stats.norm(0, 0.2))
+        self.assertTrue(zero.mu_hat == 0)
+        self.assertTrue(abs(np.mean(zero.rndm_vec(10**5, np.random.default_rng(1)))) < 0.01)
+        self.assertTrue(cmp_stkup.stkup_dim('z', 1, -1, 2, mu_hat=0, std_hat=0.2).mu_hat == 0)
+        self.assertRaises(SyntaxError, cmp_stkup.stkup_dim, 'z', 1, -1, 2, dist=stats.norm(0, 0.2),
+                          mu_hat=0)
+        self.assertTrue(np.isclose(dims[0].std_hat, skew.std()))
+        for dim in dims:
+            x = dim.rndm_vec(10**5, rng=1)
+            self.assertTrue(abs(np.mean(x) - dim.mu_hat) < 0.02)
+            self.assertTrue(abs(np.std(x) - dim.std_hat) < 0.02)
+            q = np.array([0.01, 0.5, 0.99])
+            self.assertTrue(np.allclose(dim.cdf(dim.ppf(q)), q, atol=1e-3))
+        self.assertTrue(np.allclose(dims[0].ppf(q), skew.ppf(q), atol=1e-3))
+        dim = cmp_stkup.stkup_dim('n', 1, 4, 9, dist=stats.norm(6, 0.5))
+        self.assertTrue(dim.dist == 'norm' and dim.mu_hat == 6 and dim.std_hat == 0.5)
+        self.assertRaises(SyntaxError, cmp_stkup.stkup_dim, 'g', 1, 4, 9, dist='gennorm')
+        self.assertRaises(SyntaxError, cmp_stkup.stkup_dim, 's', 1, 4, 9, dist=skew, Ppk_min=1)
+        stk = cmp_stkup.stkup(self.dim_a, *dims)
+        acc = stk.mc_stream(draws=10**6, lsl=23, usl=27, seed=1)
+        self.assertTrue(np.isclose(stk.conv_dppm(lsl=23, usl=27), acc.count_dppm(), rtol=0.02))
+
+
+
+    def test_mc_adaptive(self):
+        acc, half = self.stk.mc_adaptive(0.01, metric='mean', seed=1)
+        self.assertTrue(half <= 0.01 and np.isclose(half, acc.ci('mean')))
+        self.assertTrue(abs(acc.mean - self.stk.nominal) < 3 * 0.01)
+        th_n = (1.96 * self.stk.stats('std') / 0.01) ** 2
+        self.assertTrue(th_n <= acc.n < 3 * th_n)
+        acc, half = self.stk.mc_adaptive(0.1, metric='dppm', lsl=2, usl=11, seed=1)
+        self.assertTrue(half <= 0.1 and acc.below + acc.above > 300)
+        acc, half = self.stk.mc_adaptive(1e-6, metric='std', max_draws=10**5, seed=1)
+        self.assertTrue(acc.n == 10**5 and half > 1e-6)
+        self.assertRaises(SyntaxError, self.stk.mc_adaptive, 0.1, metric='dppm')
+        for kw in ({'start': 0}, {'max_draws': 0}):
+            self.assertRaises(SyntaxError, self.stk.mc_adaptive, 0.1, **kw)
+        # balanced Sobol rounds: powers of 2 per worker, no balance warning
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            acc, half = self.stk.mc_adaptive(0.01, seed=1, sampler='sobol', chunk=10**4,
+                                             max_draws=3 * 10**5)
+        self.assertTrue(half <= 0.01 and acc.n <= 3 * 10**5)
+        self.assertTrue(abs(acc.mean - self.stk.nominal) < 0.01)
+
+
+
+    def test_mc_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = mc_store.mc_store(tmp, max_bytes=2 * (8 * 10**5 + 128))
+            pop = self.stk.monte_carlo(draws=10**5, seed=1, workers=2, store=store)
+            self.assertTrue(isinstance(pop, np.memmap) and len(pop) == 10**5)
+            self.assertTrue(np.array_equal(pop, self.stk.monte_carlo(draws=10**5, seed=1, workers=2)))
+            again = self.stk.monte_carlo(draws=10**5, seed=1, workers=2, store=store)
+            self.assertTrue(again.filename == pop.filename)
+            dppm = self.stk.calc_dppm(pop, lsl=2, usl=11, dist='empirical')
+            self.assertTrue(np.isclose(dppm, (np.sum(pop < 2) + np.sum(pop > 11)) * 10))
+            self.stk.monte_carlo(draws=10**5, seed=2, store=store)
+            self.stk.monte_carlo(draws=10**5, seed=3, store=store)
+            self.assertTrue(len(os.listdir(tmp)) == 2)
+            self.assertFalse(os.path.exists(pop.filename))
+            self.assertRaises(SyntaxError, self.stk.monte_carlo, store=store)
+            # seeded populations depend on chunk size, stored apart
+            store = mc_store.mc_store(os.path.join(tmp, 'chunk'))
+            small = self.stk.monte_carlo(draws=10**5, seed=1, chunk=10**4, store=store)
+            big = self.stk.monte_carlo(draws=10**5, seed=1, chunk=10**5, store=store)
+            self.assertTrue(big.filename != small.filename)
+            self.assertTrue(np.array_equal(big, self.stk.monte_carlo(draws=10**5, seed=1,
+                                                                     chunk=10**5)))
+
+
+
+    def test_calc_dppm(self):
+        pop = np.random.default_rng(1).normal(10, 1, 10**4)
+        mu, std = stats.norm.fit(pop)
+        th = (stats.norm.cdf(7, mu, std) + stats.norm.sf(12, mu, std)) * 10**6
+        self.assertTrue(np.isclose(self.stk.calc_dppm(pop, lsl=7, usl=12), th))
+        self.assertTrue(np.isclose(self.stk.calc_dppm(pop, lsl=7), stats.norm.cdf(7, mu, std) * 10**6))
+        dppm, pval = self.stk.calc_dppm(pop, lsl=7, usl=12, pval=True)
+        self.assertTrue(np.isclose(dppm, th) and 0 <= pval <= 1)
+        lsl = np.array([7, 8, np.nan, 9.5])
+        usl = np.array([12, np.nan, 11, 10.5])
+        for dist in ('norm', 'empirical'):
+            r = self.stk.calc_dppm(pop, lsl=lsl, usl=usl, dist=dist)
+            self.assertTrue(r.shape == (4,))
+            for i in range(4):
+                one = self.stk.calc_dppm(pop, lsl=None if np.isnan(lsl[i]) else lsl[i],
+                                         usl=None if np.isnan(usl[i]) else usl[i], dist=dist)
+                self.assertTrue(np.isclose(r[i], one))
+        self.assertTrue(np.isclose(r[3], np.sum(np.abs(pop - 10) > 0.5) * 100))
+        self.assertTrue(np.isclose(self.stk.calc_dppm(list(pop), 7, 12, dist='empirical'),
+                                   self.stk.calc_dppm(pop, 7, 12, dist='empirical')))
+        self.assertRaises(SyntaxError, self.stk.calc_dppm, pop, lsl=lsl, usl=lsl)
+        self.assertRaises(SyntaxError, cmp_stkup.dppm_eval, pop, dist='gamma')
+        segs = columnar.segments.from_arrays(pop, np.arange(len(pop)) % 3)
+        for dist in ('norm', 'empirical'):
+            r, pval = self.stk.calc_dppm(segs, lsl=7, usl=12, dist=dist, pval=True)
+            self.assertTrue(r.shape == (3,) and pval.shape == (3,))
+            for i in range(3):
+                self.assertTrue(np.isclose(r[i], self.stk.calc_dppm(pop[i::3], 7, 12, dist=dist)))
+        self.assertRaises(SyntaxError, self.stk.calc_dppm, segs, 7, 12, dist='gamma')
+
+
+    def test_compare(self):
+        r = self.stk.compare(lsl=2, usl=11, draws=10**5, seed=1, verbose=False)
+        self.assertTrue(isinstance(r, cmp_stkup.stkup_result))
+        self.assertTrue((r.wc_min, r.wc_max) == self.stk.worst_case())
+        self.assertTrue(np.isclose(r.std, self.stk.stats('std')))
+        self.assertTrue(r.mc_draws == 10**5 and r.seed == 1 and r.mc_metric is None)
+        acc = self.stk.mc_stream(draws=10**5, lsl=2, usl=11, seed=1)
+        self.assertTrue(np.isclose(r.mc_count_dppm, acc.count_dppm()))
+        self.assertTrue(set(r.timings) == {'worst_case', 'rss', 'monte_carlo', 'convolution'})
+        self.assertTrue(json.loads(r.to_json())['mc_draws'] == 10**5)
+        row = r.to_series()
+        self.assertTrue(row['time_monte_carlo'] == r.timings['monte_carlo'])
+        r = self.stk.compare(verbose=False)
+        self.assertTrue(r.mc_metric == 'std' and r.mc_precision <= 0.1 * r.std)
+        self.assertTrue(r.std_dppm is None and isinstance(r.seed, int))
+
+
+unittest.main()
@@ -130,6 +130,16 @@ class test_norm_tests(unittest.TestCase):
         for v in r.keys():
             self.assertTrue(len(r[v]) == 2)
 
+
+    def test_batch_segments(self):
+        long = self.multiple.melt()
+        segs = norm_tests.columnar.segments.from_frame(long, 'variable', 'value')
+        r = norm_tests.batch(segs)
+        self.assertTrue(list(r.columns) == ['cat', 'AD', 'kolgomorov', 'shap_wilk'])
+        self.assertTrue(len(r) == self.multiple.shape[1])
+        for i, c in enumerate(r['cat']):
+            self.assertTrue(r['shap_wilk'][i] == norm_tests.shap_wilk(self.multiple[c]))
+
     
 unittest.main()
 
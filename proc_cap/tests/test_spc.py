@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import unittest
+from proc_cap import spc
+
+class test_spc(unittest.TestCase):
+
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.cats = np.arange(2000) % 4
+        self.base = rng.normal(10, 1, 2000)
+        # category 1 drifts by one sigma after the baseline
+        self.new = rng.normal(10, 1, 2000) + np.where(self.cats == 1, 1, 0)
+
+
+    def _split(self, ch, cut=777):
+        '''
+        Return alarms of new values checked at once and in two batches
+        '''
+        whole = ch().fit(self.base, self.cats).update(self.new, self.cats)
+        part = ch().fit(self.base, self.cats)
+        part = pd.concat([part.update(self.new[:cut], self.cats[:cut]),
+                          part.update(self.new[cut:], self.cats[cut:])])
+        key = ['cat', 'chart', 'rule', 'index']
+        whole = whole.sort_values(key).reset_index(drop=True)
+        part = part.sort_values(key).reset_index(drop=True)
+        self.assertTrue(np.all(whole[key] == part[key]))
+        self.assertTrue(np.allclose(whole['value'], part['value']))
+        return whole
+
+
+    def test_western_electric(self):
+        z = np.array([0, 3.5, 2.5, 0, 2.5, 1.5, -1.5, 1.2, 1.1, 1.3, 0.5, 0.2, 0.3, 0.1, 0.4])
+        r = spc.western_electric(z)
+        self.assertTrue(list(np.flatnonzero(r['WE1'])) == [1])
+        self.assertTrue(list(np.flatnonzero(r['WE2'])) == [2, 4])
+        self.assertTrue(list(np.flatnonzero(r['WE3'])) == [5, 8, 9])
+        self.assertTrue(list(np.flatnonzero(r['WE4'])) == [14])
+        # tail of previous batch completes patterns
+        st = {'tail': np.zeros(0)}
+        parts = [spc.western_electric(z[:9], st), spc.western_electric(z[9:], st)]
+        for rule in r:
+            self.assertTrue(np.all(np.concatenate([p[rule] for p in parts]) == r[rule]))
+        self.assertTrue(len(st['tail']) == 7)
+        self.assertTrue(list(spc.western_electric(z, rules=False)) == ['WE1'])
+
+
+    def test_imr(self):
+        r = self._split(spc.imr)
+        ch = spc.imr().fit(self.base, self.cats)
+        lim = ch.limits()
+        self.assertTrue(list(lim['cat']) == [0, 1, 2, 3])
+        self.assertTrue(np.allclose(lim['sigma'], 1, rtol=0.1))
+        self.assertTrue(np.allclose(lim['center'], [np.mean(self.base[self.cats == c])
+                                                    for c in range(4)]))
+        self.assertTrue(np.sum(r['cat'] == 1) > 5 * np.sum(r['cat'] == 0))
+        ch.update(self.new, self.cats)
+        self.assertTrue(np.allclose(ch.live.stats()['mu'],
+                                    [np.mean(self.new[self.cats == c]) for c in range(4)]))
+        self.assertTrue(np.allclose(ch.acc.stats()['mu'], lim['center']))
+        self.assertRaises(SyntaxError, ch.update, self.new, self.cats + 1)
+        self.assertRaises(SyntaxError, spc.imr().fit, self.base[:5], [0, 0, 1, 1, 2])
+        self.assertRaises(SyntaxError, spc.imr().fit, np.ones(10))
+        # refit replaces limits, state and live statistics
+        ch.fit(self.base[self.cats < 2], self.cats[self.cats < 2])
+        self.assertTrue(list(ch.limits()['cat']) == [0, 1] and len(ch.live.stats()) == 0)
+        self.assertTrue(list(ch.state) == [0, 1] and ch.state[0]['index'] == 0)
+        self.assertRaises(SyntaxError, ch.update, self.new, self.cats)
+
+
+    def test_empty(self):
+        for ch in (spc.imr(), spc.ewma(), spc.cusum()):
+            ref = ch.fit(self.base, self.cats).update(self.new, self.cats)
+            ch.fit(self.base, self.cats)
+            for empty in ([], np.zeros(0)):
+                r = ch.update(empty)
+                self.assertTrue(len(r) == 0 and list(r.columns) == list(ref.columns))
+                self.assertTrue(len(ch.update(empty, cats=[])) == 0)
+            r = ch.update(self.new, self.cats)
+            self.assertTrue(np.all(r.values == ref.values))
+        ch = spc.xbar_r().fit(np.random.default_rng(6).normal(10, 1, (100, 5)))
+        self.assertTrue(len(ch.update([])) == 0)
+
+
+    def test_xbar_r(self):
+        rng = np.random.default_rng(6)
+        ch = spc.xbar_r().fit(rng.normal(10, 1, (1000, 5)))
+        lim = ch.limits().iloc[0]
+        self.assertTrue(np.isclose(lim['sigma'], 1 / np.sqrt(5), rtol=0.05))
+        self.assertTrue(np.isclose(lim['r_ucl'], 4.918, rtol=0.05) and lim['r_lcl'] == 0)
+        self.assertTrue(len(ch.update(rng.normal(10, 1, (100, 5)))) < 10)
+        r = ch.update(rng.normal(11, 1, (100, 5)))
+        self.assertTrue(np.sum(r['chart'] == 'Xbar') > 50)
+        self.assertTrue(r['index'].min() >= 100)
+        self.assertRaises(SyntaxError, ch.update, rng.normal(10, 1, (10, 4)))
+        self.assertRaises(SyntaxError, spc.xbar_r().fit, rng.normal(10, 1, 100))
+        ch.fit(rng.normal(10, 1, (1000, 4)))
+        self.assertTrue(len(ch.update(rng.normal(10, 1, (100, 4)))) < 10)
+
+
+    def test_ewma(self):
+        r = self._split(spc.ewma)
+        lam = 0.2
+        ch = spc.ewma(lam=lam).fit(self.base, self.cats)
+        lim = ch.limits()
+        x = self.new[self.cats == 1]
+        z = np.empty(len(x))
+        prev = lim['center'][1]
+        for i, v in enumerate(x):
+            prev = z[i] = lam * v + (1 - lam) * prev
+        out = r[r['cat'] == 1]
+        self.assertTrue(np.allclose(out['value'], z[out['index']]))
+        self.assertTrue(len(out) > 10 * max(1, len(r) - len(out)))
+        self.assertRaises(SyntaxError, spc.ewma, lam=0)
+
+
+    def test_cusum(self):
+        r = self._split(spc.cusum)
+        ch = spc.cusum(k=0.5, h=5).fit(self.base, self.cats)
+        lim = ch.limits()
+        x = (self.new[self.cats == 1] - lim['center'][1]) / lim['sigma'][1]
+        hi = np.empty(len(x))
+        prev = 0
+        for i, v in enumerate(x):
+            prev = hi[i] = max(0, prev + v - 0.5)
+        out = r[(r['cat'] == 1) & (r['rule'] == 'C+')]
+        self.assertTrue(list(out['index']) == list(np.flatnonzero(hi > 5)))
+        self.assertTrue(np.allclose(out['value'], hi[hi > 5]))
+        self.assertTrue(len(out) > 10 * max(1, np.sum(r['cat'] != 1)))
+
+
+unittest.main()
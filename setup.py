@@ -95,7 +95,7 @@ if __name__ == '__main__':
                 "License :: OSI Approved :: MIT License",
                 "Operating System :: OS Independent",
             ],
-            python_requires='>=3.6'
+            python_requires='>=3.7'
         )
 
         